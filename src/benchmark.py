@@ -0,0 +1,140 @@
+# pip install pandas
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Union
+import pandas
+import core
+import pipeline
+import synthetic_data
+
+DEFAULT_SIZES:List[int] = [10_000, 100_000, 1_000_000]
+
+def get_commit() -> Union[str, None]:
+    """ Current git commit, to compare results between commits. """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output = True, text = True, check = True,
+            cwd = os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def measure_loads(size:int, tables:dict[str, core.ETL], engines:List[str]) -> List[dict]:
+    """
+    Load throughput of every warehouse table: the rows it saved, written again
+    as a csv file and into every sql engine (one fresh database per engine).
+    """
+    records = []
+    for name, table in tables.items():
+        if not name.startswith('warehouse.'):
+            continue
+        paths = [path for path in table.get_table_paths() if os.path.exists(path)]
+        df = pandas.concat([core.get_data(csv_path = path, schema = table.output_schema) for path in paths], ignore_index = True)
+
+        targets = {'csv' : None}
+        targets.update({engine : core.SqlTarget(f'load_bench.{engine}', engine = engine) for engine in engines})
+        for target_name, target in targets.items():
+            core.reset_peak_rss()
+            wall = time.perf_counter()
+            if target is None:
+                core.save_data(df, 'load_bench.csv')
+            else:
+                target.write(table.table_name, df, table.output_schema, table.sql_keys, table.sql_indexes)
+            records.append({
+                'size'        : size,
+                'table'       : table.table_name,
+                'step'        : f'load_{target_name}',
+                'wall_s'      : time.perf_counter() - wall,
+                'rows_in'     : len(df),
+                'rows_out'    : len(df),
+                'peak_rss_mb' : core.get_rss_mb()[1],
+                'traced_mb'   : None
+            })
+    return records
+
+def run_size(size:int, workdir:str, seed:int, trace_memory:bool, engines:List[str] = []) -> List[dict]:
+    """
+    Runs every table once, one after another, over synthetic inputs of the
+    given size. Runs on its own process so peak memory belongs to this size.
+    """
+    # same layout the stage modules expect (docs/...), relative to the workdir.
+    for folder in ('input_files', 'output_stagging', 'output_validation', 'output_data_warehouse'):
+        os.makedirs(os.path.join(workdir, 'docs', folder), exist_ok = True)
+    synthetic_data.generate(
+        output_dir = os.path.join(workdir, 'docs', 'input_files'),
+        invoices   = size,
+        customers  = max(100, size // 100),
+        products   = max(50, size // 1000),
+        seed       = seed
+    )
+    os.chdir(workdir)
+
+    metrics = core.enable_metrics(trace_memory = trace_memory)
+    tables = pipeline.get_tables()
+    for table in tables.values():
+        table.run()
+    return [dict(record, size = size) for record in metrics.records] + measure_loads(size, tables, engines)
+
+def summarize(records:List[dict]) -> pandas.DataFrame:
+    """ Throughput (rows per second) and peak memory per size, table and step. """
+    df = pandas.DataFrame(records)
+    df['rows'] = df[['rows_in', 'rows_out']].max(axis = 1)
+    summary = df.groupby(['size', 'table', 'step'], sort = False).agg(
+        wall_s      = ('wall_s', 'sum'),
+        rows        = ('rows', 'sum'),
+        peak_rss_mb = ('peak_rss_mb', 'max'),
+        traced_mb   = ('traced_mb', 'max')
+    )
+    summary['rows_per_s'] = (summary['rows'] / summary['wall_s']).round(0)
+    return summary.round(3)
+
+def compare(current:pandas.DataFrame, previous_path:str) -> pandas.DataFrame:
+    """ Wall time and peak memory ratios against a previous results file (>1 is slower). """
+    with open(previous_path, encoding = 'utf-8') as file:
+        previous = summarize(json.load(file)['records'])
+    ratios = pandas.DataFrame({
+        'wall_ratio'   : current['wall_s'] / previous['wall_s'],
+        'memory_ratio' : current['peak_rss_mb'] / previous['peak_rss_mb']
+    })
+    return ratios.dropna().round(2)
+
+
+if __name__ == "__main__":
+
+    # python src/benchmark.py --sizes 10000 100000 1000000 --output bench.json
+    # python src/benchmark.py --compare bench.json   (against a previous commit)
+    parser = argparse.ArgumentParser(description = 'Benchmarks every ETL table over synthetic data.')
+    parser.add_argument('--sizes', type = int, nargs = '+', default = DEFAULT_SIZES, help = 'invoice lines.')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--trace-memory', action = 'store_true', help = 'tracemalloc peaks per step (slower).')
+    parser.add_argument('--output', default = None, help = 'json file for the results.')
+    parser.add_argument('--compare', default = None, help = 'previous results file.')
+    parser.add_argument('--sql', nargs = '*', choices = ['duckdb', 'sqlite'], default = [], help = 'also measure loading the warehouse tables into these engines.')
+    parser.add_argument('--keep', action = 'store_true', help = 'keep the generated files.')
+    args = parser.parse_args()
+
+    records = []
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp(prefix = f'alegra_bench_{size}_')
+        try:
+            with ProcessPoolExecutor(max_workers = 1) as executor:
+                records += executor.submit(run_size, size, workdir, args.seed, args.trace_memory, args.sql).result()
+        finally:
+            if not args.keep:
+                shutil.rmtree(workdir, ignore_errors = True)
+
+    summary = summarize(records)
+    print(summary.to_string())
+
+    if args.output:
+        with open(args.output, 'w', encoding = 'utf-8') as file:
+            json.dump({'commit' : get_commit(), 'sizes' : args.sizes, 'records' : records}, file, indent = 1)
+    if args.compare:
+        print(compare(summary, args.compare).to_string())
@@ -1,80 +1,730 @@
 
+import functools
+import glob
+import hashlib
+import importlib.util
+import json
+import os
+import resource
+import shutil
+import threading
+import time
+import tracemalloc
+import numpy
 import pandas
-import random
-import string
-from typing import Union
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Iterator, Union
 
 # data management related
-def get_data(csv_path:str) -> Union[pandas.DataFrame, None]:
-    """ Generic function for reading data from csv file. """
+
+# one timestamp per run, shared by every table (ingestion and last modified dates).
+RUN_TIMESTAMP:pandas.Timestamp = pandas.Timestamp.now().floor('s')
+
+# storage formats, picked by file extension unless one is given explicitly.
+# parquet and feather (arrow ipc) need pyarrow installed: pip install pyarrow
+STORAGE_FORMATS:dict[str,str] = {
+    '.csv'     : 'csv',
+    '.parquet' : 'parquet',
+    '.feather' : 'feather',
+    '.arrow'   : 'feather'
+}
+
+# csv files with a schema are parsed in blocks of rows and concatenated once
+# typed, so the parser's copy of the text columns is never held for the whole file.
+CSV_BLOCK_ROWS:int = 250_000
+
+def get_storage_format(csv_path:str, storage_format:Union[str, None] = None) -> str:
+    """ Storage format of a table file, from its extension when not given. """
+    if storage_format is not None:
+        return storage_format
+    return STORAGE_FORMATS.get(os.path.splitext(csv_path)[1].lower(), 'csv')
+
+def get_format_path(csv_path:str, storage_format:Union[str, None]) -> str:
+    """
+    Path with the extension of a storage format, so readers picking the format
+    from the extension read the file as written (unchanged when it matches).
+    """
+    if storage_format is None or get_storage_format(csv_path) == storage_format:
+        return csv_path
+    extensions = [extension for extension, name in STORAGE_FORMATS.items() if name == storage_format]
+    if not extensions:
+        raise ValueError(f'unknown storage format: {storage_format}')
+    return os.path.splitext(csv_path)[0] + extensions[0]
+
+def apply_schema(dataframe:pandas.DataFrame, schema:Union[dict[str,str], None]) -> pandas.DataFrame:
+    """ Casts the columns present in the schema ({column : dtype}) that don't match it yet. """
+    if not schema:
+        return dataframe
+    casts = {
+        column : dtype for column, dtype in schema.items()
+        if column in dataframe.columns and str(dataframe[column].dtype) != dtype
+    }
+    return dataframe.astype(casts) if casts else dataframe
+
+def get_csv_options(schema:Union[dict[str,str], None], columns:Union[list[str], None] = None) -> dict:
+    """ read_csv dtype / parse_dates options for a schema, so csv types are not inferred. """
+    schema = schema or {}
+    date_columns = [
+        column for column, dtype in schema.items()
+        if dtype.startswith('datetime64') and (columns is None or column in columns)
+    ]
+    return {
+        'dtype'       : {
+            column : dtype for column, dtype in schema.items()
+            if not dtype.startswith('datetime64')
+        } or None,
+        'parse_dates' : date_columns or None
+    }
+
+# fused runs: outputs handed to the next tables in memory, by output path,
+# instead of being parsed again from the files (see enable_frame_store).
+class FrameStore:
+    """
+    In memory outputs of the tables of the process. Readers get a shallow copy,
+    so a frame shared by many tables (e.g. the validated invoices, read by the
+    time dimension and the fact table) is never changed by one of them. Only
+    outputs with tables still to read them are kept (see expect / release).
+    """
+
+    frames: dict = None
+
+    def __init__(self) -> None:
+        self.frames = {} # {path : [frames]}, appended chunks are joined on first read.
+        self.versions:dict[str, int] = {}
+        self.readers:dict[str, int] = {} # {path : tables still to read it}
+        self.lock = threading.Lock()
+
+    def has(self, path:Any) -> bool:
+        return isinstance(path, str) and path in self.frames
+
+    def expect(self, path:str, readers:int = 1) -> None:
+        """ Keeps the output of a path in memory until it's released by that many readers. """
+        with self.lock:
+            self.readers[path] = self.readers.get(path, 0) + readers
+
+    def release(self, path:str) -> None:
+        """ One reader of a path has finished, its frames are dropped after the last one. """
+        with self.lock:
+            self.readers[path] = self.readers.get(path, 0) - 1
+            if self.readers[path] <= 0:
+                self.readers.pop(path)
+                self.frames.pop(path, None)
+
+    def put(self, path:str, dataframe:pandas.DataFrame, append:bool = False) -> bool:
+        """ Keeps a saved output when some table will read it, returns whether it was kept. """
+        with self.lock:
+            if self.readers.get(path, 0) <= 0:
+                return False
+            if append and path not in self.frames:
+                # the previous rows are only on the file, which stays the source.
+                return False
+            self.frames[path] = self.frames[path] + [dataframe] if append else [dataframe]
+            self.versions[path] = self.versions.get(path, 0) + 1
+            return True
+
+    def get(self, path:str) -> pandas.DataFrame:
+        with self.lock:
+            if len(self.frames[path]) > 1:
+                self.frames[path] = [pandas.concat(self.frames[path], ignore_index = True)]
+            return self.frames[path][0].copy(deep = False)
+
+    def get_signature(self, path:str) -> tuple:
+        """ Changes on every put, as a file signature (see DimensionKeyCache). """
+        return ('memory', self.versions[path])
+
+# None reads every table from its file, see enable_frame_store.
+FRAMES: Union[FrameStore, None] = None
+
+def enable_frame_store() -> FrameStore:
+    """ Turns on the fused mode: saved outputs are also kept in memory and read from there. """
+    global FRAMES
+    FRAMES = FrameStore()
+    return FRAMES
+
+def get_data(
+        csv_path:str,
+        nrows:Union[int, None] = None,
+        columns:Union[list[str], None] = None,
+        schema:Union[dict[str,str], None] = None,
+        storage_format:Union[str, None] = None
+    ) -> Union[pandas.DataFrame, None]:
+    """
+    Generic function for reading a table file (csv, parquet or feather).
+    Only the given columns are read, and the schema ({column : dtype}) avoids
+    inferring types again on csv files; columnar files already keep them.
+    """
     try:
-        data = pandas.read_csv(csv_path)
-        return data
+        if FRAMES is not None and FRAMES.has(csv_path):
+            data = FRAMES.get(csv_path)
+            data = data if columns is None else data[columns]
+            return apply_schema(data if nrows is None else data.head(nrows), schema)
+
+        storage_format = get_storage_format(csv_path, storage_format)
+        if storage_format == 'csv' and schema:
+            with pandas.read_csv(
+                csv_path,
+                nrows = nrows,
+                usecols = columns,
+                chunksize = CSV_BLOCK_ROWS,
+                **get_csv_options(schema, columns)
+            ) as reader:
+                data = pandas.concat(
+                    [apply_schema(block, schema) for block in reader],
+                    ignore_index = True
+                )
+        elif storage_format == 'csv':
+            data = pandas.read_csv(csv_path, nrows = nrows, usecols = columns)
+        elif storage_format == 'parquet':
+            data = pandas.read_parquet(csv_path, columns = columns)
+        elif storage_format == 'feather':
+            data = pandas.read_feather(csv_path, columns = columns)
+        else:
+            raise ValueError(f'unknown storage format: {storage_format}')
+
+        if nrows is not None and storage_format != 'csv':
+            data = data.head(nrows)
+        return apply_schema(data, schema)
     except Exception as e:
         print('get_data >>>', str(e))
         return None
 
-def save_data(dataframe:pandas.DataFrame, csv_path:str) -> bool:
-    """ Generic function for reading data from csv file. """
+def get_data_chunks(
+        csv_path:str,
+        chunk_size:int,
+        schema:Union[dict[str,str], None] = None,
+        storage_format:Union[str, None] = None
+    ) -> Iterator[pandas.DataFrame]:
+    """ Generic function for reading a table file in chunks of fixed size. """
+    storage_format = get_storage_format(csv_path, storage_format)
+    if FRAMES is not None and FRAMES.has(csv_path):
+        data = FRAMES.get(csv_path)
+        for start in range(0, len(data), chunk_size):
+            yield apply_schema(data.iloc[start:start + chunk_size], schema)
+    elif storage_format == 'csv':
+        with pandas.read_csv(csv_path, chunksize = chunk_size, **get_csv_options(schema)) as reader:
+            for chunk in reader:
+                yield apply_schema(chunk, schema)
+    elif storage_format == 'parquet':
+        import pyarrow.parquet
+        for batch in pyarrow.parquet.ParquetFile(csv_path).iter_batches(batch_size = chunk_size):
+            yield apply_schema(batch.to_pandas(), schema)
+    else:
+        # feather files are memory mapped, only the batches being converted are loaded.
+        import pyarrow.feather
+        table = pyarrow.feather.read_table(csv_path, memory_map = True)
+        for batch in table.to_batches(max_chunksize = chunk_size):
+            yield apply_schema(batch.to_pandas(), schema)
+
+def is_many_files(input_path:Union[str, list[str]]) -> bool:
+    """ Whether an input is a list of files or a glob pattern (e.g. one file per day). """
+    return not isinstance(input_path, str) or any(character in input_path for character in '*?[')
+
+def get_input_files(input_path:Union[str, list[str]]) -> list[str]:
+    """ Files of an input: a path, a glob pattern or a list of both, in a stable order. """
+    patterns = [input_path] if isinstance(input_path, str) else input_path
+    files = []
+    for pattern in patterns:
+        files += sorted(glob.glob(pattern)) if is_many_files(pattern) else [pattern]
+    return files
+
+def add_source_column(
+        dataframe:pandas.DataFrame, source:str, files:list[str], column:str
+    ) -> pandas.DataFrame:
+    """ Adds the file every row came from, as a categorical of all the input files. """
+    dataframe[column] = pandas.Categorical.from_codes(
+        numpy.full(len(dataframe), files.index(source), dtype = numpy.int32),
+        categories = files
+    )
+    return dataframe
+
+def get_many_data(
+        input_path:Union[str, list[str]],
+        columns:Union[list[str], None] = None,
+        schema:Union[dict[str,str], None] = None,
+        source_column:str = 'source_file',
+        max_workers:int = 8
+    ) -> Union[pandas.DataFrame, None]:
+    """
+    Reads many table files (a glob pattern or a list) on a bounded thread pool,
+    the csv parser releases the GIL, and concatenates them once. The file of
+    every row is kept on the source column.
+    """
+    files = get_input_files(input_path)
+    if not files:
+        print('get_many_data >>>', f'no files for {input_path}')
+        return None
+
+    def read(path:str) -> Union[pandas.DataFrame, None]:
+        data = get_data(csv_path = path, columns = columns, schema = schema)
+        return None if data is None else add_source_column(data, path, files, source_column)
+
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        frames = list(executor.map(read, files))
+    if any(frame is None for frame in frames):
+        return None
+    return pandas.concat(frames, ignore_index = True)
+
+def get_many_data_chunks(
+        input_path:Union[str, list[str]],
+        chunk_size:int,
+        schema:Union[dict[str,str], None] = None,
+        source_column:str = 'source_file'
+    ) -> Iterator[pandas.DataFrame]:
+    """ Chunks of every file of an input, one file after another, with the file of every row. """
+    files = get_input_files(input_path)
+    for path in files:
+        for chunk in get_data_chunks(csv_path = path, chunk_size = chunk_size, schema = schema):
+            yield add_source_column(chunk, path, files, source_column)
+
+def save_data(
+        dataframe:pandas.DataFrame,
+        csv_path:str,
+        append:bool = False,
+        storage_format:Union[str, None] = None
+    ) -> bool:
+    """ Generic function for writing a table file, optionally appending to it (csv only). """
     try:
-        dataframe.to_csv(
-            path_or_buf = csv_path,
-            index = False,
-            encoding = 'utf-8'
-        )
+        storage_format = get_storage_format(csv_path, storage_format)
+        if storage_format == 'csv':
+            dataframe.to_csv(
+                path_or_buf = csv_path,
+                index = False,
+                encoding = 'utf-8',
+                mode = 'a' if append else 'w',
+                header = not append
+            )
+        elif append:
+            raise ValueError(f'appending is not supported on {storage_format} files')
+        elif storage_format == 'parquet':
+            dataframe.to_parquet(csv_path, index = False)
+        elif storage_format == 'feather':
+            dataframe.reset_index(drop = True).to_feather(csv_path)
+        else:
+            raise ValueError(f'unknown storage format: {storage_format}')
         return True
     except Exception as e:
         print('save_data >>>', str(e))
         return False
 
-def insert_ids(dataframe:pandas.DataFrame, starting_id:int) -> pandas.DataFrame:
-    _dataframe = dataframe.copy()
-    _dataframe.insert(0, 'id', range(starting_id, starting_id + len(_dataframe)))
-    return _dataframe
-
-
-# utils
-def get_week_day_name(day:int) -> Union[str, None]:
-    DAYS_OF_WEEK = {
-        0 : "Monday",
-        1 : "Tuesday",
-        2 : "Wednesday",
-        3 : "Thursday",
-        4 : "Friday",
-        5 : "Saturday",
-        6 : "Sunday"
-    }
-    return DAYS_OF_WEEK.get(day, None)
-
-def get_month_name(month:int) -> Union[str, None]:
-    MONTHS = {
-        1  : "January",     7  : "July",
-        2  : "February",    8  : "August",
-        3  : "March",       9  : "September",
-        4  : "April",       10 : "October",
-        5  : "May",         11 : "November",
-        6  : "June",        12 : "December"
-    }
-    return MONTHS.get(month, None)
-
-def get_semester(month:int) -> int:
-    return 1 if month < 7 else 2
-
-def get_mock_phone_number() -> str:
-    """ Returns a mock phone number similar to the mexican format. """
-    return ''.join([
-        '+52',
-        ''.join(random.sample(string.digits, 10))
-    ])
-
-def get_mock_email() -> str:
-    """ Returns a mock email adress. """
-    return ''.join([
-        ''.join(random.sample(string.ascii_letters, 10)),
-        '@',
-        ''.join(random.sample(string.ascii_lowercase, 6)),
-        '.com'
-    ])
+class ChunkWriter:
+    """
+    Writes the chunks of a streamed table as one parquet or feather file,
+    through an arrow writer kept open between chunks (those files can't be
+    appended to). The first chunk sets the arrow schema of the file.
+    """
+
+    csv_path: Union[str, None] = None
+    storage_format: Union[str, None] = None
+
+    def __init__(self, csv_path:str, storage_format:str) -> None:
+        if storage_format not in ('parquet', 'feather'):
+            raise ValueError(f'no chunk writer for {storage_format} files')
+        self.csv_path = csv_path
+        self.storage_format = storage_format
+        self.schema = None
+        self.writer = None
+
+    def write(self, dataframe:pandas.DataFrame) -> bool:
+        try:
+            import pyarrow
+            table = pyarrow.Table.from_pandas(dataframe, schema = self.schema, preserve_index = False)
+            if self.writer is None:
+                self.schema = table.schema
+                if self.storage_format == 'parquet':
+                    import pyarrow.parquet
+                    self.writer = pyarrow.parquet.ParquetWriter(self.csv_path, self.schema)
+                else:
+                    self.writer = pyarrow.ipc.new_file(self.csv_path, self.schema)
+            self.writer.write_table(table)
+            return True
+        except Exception as e:
+            print('ChunkWriter.write >>>', str(e))
+            return False
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+def aggregate(
+        dataframe:pandas.DataFrame, keys:list[str], measures:dict[str, tuple[str, str]]
+    ) -> pandas.DataFrame:
+    """ Additive aggregate of a frame, measures as {name : (column, 'sum' or 'size')}. """
+    return dataframe.groupby(keys, dropna = False).agg(**measures).reset_index()
+
+def merge_aggregates(
+        existing:pandas.DataFrame, delta:pandas.DataFrame, keys:list[str]
+    ) -> pandas.DataFrame:
+    """ Adds the delta of an additive aggregate into the existing one, by keys. """
+    measures = [column for column in delta.columns if column not in keys]
+    return (
+        pandas.concat([existing, delta], ignore_index = True)
+        .groupby(keys, dropna = False)[measures].sum()
+        .reset_index()
+    )
+
+def build_frame(
+        dataframe:pandas.DataFrame, columns:dict[str, Any], starting_id:Union[int, None] = None
+    ) -> pandas.DataFrame:
+    """
+    Output frame of a table from its declared columns: {column : source}, where
+    a source is an input column name, a function of the input frame or the
+    values themselves. The frame is assembled once, input columns are shared
+    instead of copied; with a starting_id, surrogate ids go first.
+    """
+    data = {}
+    if starting_id is not None:
+        data['id'] = numpy.arange(starting_id, starting_id + len(dataframe))
+    for column, source in columns.items():
+        if isinstance(source, str):
+            data[column] = dataframe[source]
+        elif callable(source):
+            data[column] = source(dataframe)
+        else:
+            data[column] = source
+    return pandas.DataFrame(data, index = dataframe.index, copy = False)
+
+
+# dimension keys cache
+class DimensionKeyCache:
+    """
+    Natural key -> surrogate id maps of the dimension files, loaded once and
+    shared by every fact batch of the process. An entry is reloaded only when
+    its file changes (mtime or size).
+    """
+
+    entries: dict = None
+
+    def __init__(self) -> None:
+        self.entries = {}
+
+    def get(self, csv_path:str, name:str, loader:Callable[[str], Any]) -> Any:
+        """ Cached result of loader(csv_path), invalidated when the file changes. """
+        if FRAMES is not None and FRAMES.has(csv_path):
+            signature = FRAMES.get_signature(csv_path)
+        else:
+            stat = os.stat(csv_path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        entry = self.entries.get((csv_path, name))
+        if entry is None or entry[0] != signature:
+            entry = (signature, loader(csv_path))
+            self.entries[(csv_path, name)] = entry
+        return entry[1]
+
+    def get_key_map(self, csv_path:str, natural_key:str) -> Union[numpy.ndarray, pandas.Index]:
+        """
+        Array indexed by the natural key (dense non-negative integer keys) or a
+        hashed pandas.Index otherwise, mapping natural keys to surrogate ids.
+        """
+        def loader(path:str) -> tuple:
+            df = get_data(csv_path = path, columns = ['id', natural_key])
+            keys = df[natural_key]
+            if (
+                pandas.api.types.is_integer_dtype(keys)
+                and len(keys) > 0
+                and keys.min() >= 0
+                and keys.max() < 4 * len(keys) + 1024
+            ):
+                key_map = numpy.full(keys.max() + 1, -1, dtype = numpy.int64)
+                key_map[keys.to_numpy()] = df['id'].to_numpy()
+                return key_map, None
+            # the last version of a repeated natural key wins.
+            df = df.drop_duplicates(subset = natural_key, keep = 'last')
+            return pandas.Index(df[natural_key]), df['id'].to_numpy()
+
+        return self.get(csv_path, 'keys:' + natural_key, loader)
+
+    def lookup(self, csv_path:str, natural_key:str, keys:pandas.Series) -> pandas.Series:
+        """ Surrogate ids for a column of natural keys, missing keys as <NA>. """
+        key_map, ids = self.get_key_map(csv_path, natural_key)
+
+        if ids is None and pandas.api.types.is_integer_dtype(keys):
+            values = keys.to_numpy()
+            found = (values >= 0) & (values < len(key_map))
+            result = numpy.full(len(values), -1, dtype = numpy.int64)
+            result[found] = key_map[values[found]]
+        else:
+            if ids is None:
+                # non integer keys against an array map, falling back to a hashed one.
+                ids = numpy.flatnonzero(key_map >= 0)
+                key_map, ids = pandas.Index(ids), key_map[ids]
+            positions = key_map.get_indexer(keys)
+            result = numpy.where(positions >= 0, ids[positions], -1)
+
+        surrogate_ids = pandas.array(result, dtype = 'Int64')
+        surrogate_ids[result < 0] = pandas.NA
+        return pandas.Series(surrogate_ids, index = keys.index)
+
+    def get_versions(self, csv_path:str, natural_key:str) -> tuple:
+        """
+        Versions of a type 2 dimension sorted by natural key and valid_from:
+        a hashed index of the keys, where the versions of every key start and
+        how many there are, plus the ids and valid_from of every version.
+        """
+        def loader(path:str) -> tuple:
+            df = get_data(
+                csv_path = path,
+                columns  = ['id', natural_key, 'valid_from'],
+                schema   = {'valid_from' : 'datetime64[ns]'}
+            ).sort_values([natural_key, 'valid_from'], kind = 'stable')
+            first = ~df[natural_key].duplicated().to_numpy()
+            starts = numpy.flatnonzero(first)
+            counts = numpy.diff(numpy.append(starts, len(df)))
+            return (
+                pandas.Index(df[natural_key].to_numpy()[starts]), starts, counts,
+                df['id'].to_numpy(), df['valid_from'].to_numpy()
+            )
+
+        return self.get(csv_path, 'versions:' + natural_key, loader)
+
+    def lookup_as_of(
+            self, csv_path:str, natural_key:str, keys:pandas.Series, dates:pandas.Series
+        ) -> pandas.Series:
+        """ Surrogate ids of the versions that were valid at every date, missing keys as <NA>. """
+        key_index, starts, counts, ids, valid_from = self.get_versions(csv_path, natural_key)
+        positions = key_index.get_indexer(keys)
+        found = positions >= 0
+        first = starts[positions[found]]
+        versions = counts[positions[found]]
+
+        # keys with one version (most of them) take it, the others the last
+        # version starting before the date; a key has only a few versions.
+        dates = pandas.to_datetime(dates).to_numpy()[found]
+        valid = numpy.zeros(len(first), dtype = numpy.int64)
+        for version in range(versions.max() if len(versions) else 0):
+            valid += (version < versions) & (valid_from[first + numpy.minimum(version, versions - 1)] <= dates)
+
+        result = numpy.full(len(keys), -1, dtype = numpy.int64)
+        result[found] = ids[first + numpy.maximum(valid - 1, 0)]
+        surrogate_ids = pandas.array(result, dtype = 'Int64')
+        surrogate_ids[result < 0] = pandas.NA
+        return pandas.Series(surrogate_ids, index = keys.index)
+
+    def get_key_set(self, csv_path:str, natural_key:str) -> pandas.Index:
+        """ Distinct natural keys of a file, as a hashed pandas.Index (its hash table is built once). """
+        def loader(path:str) -> pandas.Index:
+            keys = get_data(csv_path = path, columns = [natural_key])[natural_key]
+            return pandas.Index(keys.dropna().unique())
+
+        return self.get(csv_path, 'key_set:' + natural_key, loader)
+
+    def contains(self, csv_path:str, natural_key:str, keys:pandas.Series) -> pandas.Series:
+        """ Whether every key exists on the file (missing keys are not found). """
+        key_set = self.get_key_set(csv_path, natural_key)
+        return pandas.Series(key_set.get_indexer(keys) >= 0, index = keys.index)
+
+DIMENSION_KEYS = DimensionKeyCache()
+
+
+# utils, vectorized: every helper takes or returns whole columns.
+DAYS_OF_WEEK = numpy.array([
+    "Monday", "Tuesday", "Wednesday", "Thursday",
+    "Friday", "Saturday", "Sunday"
+], dtype = object)
+
+MONTHS = numpy.array([
+    "January",  "February", "March",     "April",
+    "May",      "June",     "July",      "August",
+    "September","October",  "November",  "December"
+], dtype = object)
+
+def get_week_day_names(days:pandas.Series) -> pandas.Series:
+    """ Day names for a column of week days (0 = Monday). """
+    return pandas.Series(DAYS_OF_WEEK[days.to_numpy()], index = days.index)
+
+def get_month_names(months:pandas.Series) -> pandas.Series:
+    """ Month names for a column of months (1 = January). """
+    return pandas.Series(MONTHS[months.to_numpy() - 1], index = months.index)
+
+def get_semesters(months:pandas.Series) -> pandas.Series:
+    """ Semester (1 or 2) for a column of months. """
+    return pandas.Series(numpy.where(months.to_numpy() < 7, 1, 2), index = months.index)
+
+def get_hours_12(hours:pandas.Series) -> pandas.Series:
+    """ 12-hour clock value for a column of 24-hour values. """
+    return (hours - 12).abs()
+
+def translate_column(column:pandas.Series, table:dict[int,int]) -> pandas.Series:
+    """ Applies a str.maketrans table to a whole column of strings (only to the categories of a categorical one). """
+    if isinstance(column.dtype, pandas.CategoricalDtype):
+        categories = column.cat.categories.str.translate(table)
+        if categories.is_unique:
+            return column.cat.rename_categories(categories)
+        column = column.astype(object)
+    return column.str.translate(table)
+
+def get_constant_column(value:Any, size:int) -> pandas.Categorical:
+    """ A column repeating a single value, stored as one category. """
+    return pandas.Categorical.from_codes(numpy.zeros(size, dtype = numpy.int8), categories = [value])
+
+# time dimension related
+TIME_GRAINS:dict[str,str] = {
+    'day'    : '1D',
+    'hour'   : '1h',
+    'minute' : '1min'
+}
+
+def iter_calendar(
+        start_date:str, end_date:str, grain:str, starting_id:int, chunk_rows:int
+    ) -> Iterator[pandas.DataFrame]:
+    """ Lazily expands a date range into time dimension rows, one chunk at a time. """
+    delta = pandas.Timedelta(TIME_GRAINS[grain])
+    start = pandas.Timestamp(start_date)
+    end = pandas.Timestamp(end_date)
+
+    while start <= end:
+        time_range = pandas.date_range(
+            start   = start,
+            periods = min(chunk_rows, (end - start) // delta + 1),
+            freq    = delta
+        )
+        yield get_calendar(
+            dates       = pandas.Series(time_range),
+            starting_id = starting_id + (start - pandas.Timestamp(start_date)) // delta
+        )
+        start = time_range[-1] + delta
+
+def get_calendar(dates:pandas.Series, starting_id:int) -> pandas.DataFrame:
+    """ Time dimension rows (calendar parts) of some dates, with contiguous ids. """
+    return build_frame(pandas.DataFrame({'date' : dates}), {
+        'date'               : 'date',
+        'year'               : lambda df : df['date'].dt.year,
+        'quarter'            : lambda df : df['date'].dt.quarter,
+        'semester'           : lambda df : get_semesters(df['date'].dt.month),
+        'month'              : lambda df : df['date'].dt.month,
+        'month_string'       : lambda df : get_month_names(df['date'].dt.month),
+        'day'                : lambda df : df['date'].dt.day,
+        'day_of_week_string' : lambda df : get_week_day_names(df['date'].dt.day_of_week),
+        'hour_24'            : lambda df : df['date'].dt.hour,
+        'hour_12'            : lambda df : get_hours_12(df['date'].dt.hour),
+        'minutes'            : lambda df : df['date'].dt.minute,
+        'seconds'            : lambda df : df['date'].dt.second
+    }, starting_id)
+
+# time index: time dimension ids in a .npy array, position = grains elapsed since
+# its first date (-1 where there's no row), plus a .json file with that date
+# and the grain. Readers memory map it, so processes share it on the page cache.
+# Sparse time dimensions (only the dates found on the facts) use a sparse index
+# instead: a (2, rows) array with the sorted dates (int64 ns) and their ids.
+def get_time_index_meta_path(npy_path:str) -> str:
+    return os.path.splitext(npy_path)[0] + '.json'
+
+def swap_time_index(npy_path:str, meta:dict) -> None:
+    """ Puts a time index written aside (.tmp.npy) in place, readers keep mapping the previous one meanwhile. """
+    meta_path = get_time_index_meta_path(npy_path)
+    with open(meta_path + '.tmp', 'w', encoding = 'utf-8') as file:
+        json.dump(meta, file)
+    os.replace(meta_path + '.tmp', meta_path)
+    os.replace(npy_path + '.tmp.npy', npy_path)
+
+def save_time_index(
+        npy_path:str, dates:pandas.Series, ids:pandas.Series, grain:str, append:bool = False
+    ) -> None:
+    """ Writes the time index for some time dimension rows, appending extends the existing one. """
+    delta = pandas.Timedelta(TIME_GRAINS[grain])
+    meta_path = get_time_index_meta_path(npy_path)
+
+    if append and os.path.exists(npy_path):
+        with open(meta_path, encoding = 'utf-8') as file:
+            meta = json.load(file)
+        if meta['grain'] != grain:
+            raise ValueError(f"time index grain is {meta['grain']}, not {grain}")
+        if meta.get('layout') == 'sparse':
+            return save_sparse_time_index(npy_path, dates, ids, grain, append)
+        existing = numpy.load(npy_path, mmap_mode = 'r')
+    else:
+        meta = {'min_date' : str(pandas.Timestamp(dates.min())), 'grain' : grain}
+        existing = numpy.empty(0, dtype = numpy.int32)
+
+    # dates before the first one (late invoices) shift the existing positions.
+    shift = max((pandas.Timestamp(meta['min_date']) - pandas.Timestamp(dates.min())) // delta, 0)
+    if shift:
+        meta['min_date'] = str(pandas.Timestamp(meta['min_date']) - shift * delta)
+    positions = ((pandas.to_datetime(dates) - pandas.Timestamp(meta['min_date'])) // delta).to_numpy()
+    size = max(shift + len(existing), int(positions.max()) + 1 if len(positions) else 0)
+
+    index = numpy.lib.format.open_memmap(npy_path + '.tmp.npy', mode = 'w+', dtype = numpy.int32, shape = (size,))
+    index[:] = -1
+    index[shift:shift + len(existing)] = existing
+    index[positions] = ids.to_numpy()
+    index.flush()
+    del index, existing
+    swap_time_index(npy_path, dict(meta, rows = size))
+
+def save_sparse_time_index(
+        npy_path:str, dates:pandas.Series, ids:pandas.Series, grain:str, append:bool = False
+    ) -> None:
+    """
+    Writes the sparse time index of some time dimension rows. Appending merges
+    them into the existing sorted dates (searchsorted + insert, no sorting again).
+    """
+    if append and os.path.exists(npy_path):
+        existing_dates, existing_ids = get_time_index_entries(npy_path, grain)
+    else:
+        existing_dates = existing_ids = numpy.empty(0, dtype = numpy.int64)
+
+    new_dates = pandas.to_datetime(dates).to_numpy(dtype = 'datetime64[ns]').view(numpy.int64)
+    order = numpy.argsort(new_dates, kind = 'stable')
+    new_dates, new_ids = new_dates[order], ids.to_numpy(dtype = numpy.int64)[order]
+    # dates already on the index keep their id.
+    positions = numpy.searchsorted(existing_dates, new_dates)
+    repeated = positions < len(existing_dates)
+    repeated[repeated] = existing_dates[positions[repeated]] == new_dates[repeated]
+    positions, new_dates, new_ids = positions[~repeated], new_dates[~repeated], new_ids[~repeated]
+
+    size = len(existing_dates) + len(new_dates)
+    index = numpy.lib.format.open_memmap(npy_path + '.tmp.npy', mode = 'w+', dtype = numpy.int64, shape = (2, size))
+    index[0] = numpy.insert(existing_dates, positions, new_dates)
+    index[1] = numpy.insert(existing_ids, positions, new_ids)
+    index.flush()
+    del index, existing_dates, existing_ids
+    swap_time_index(npy_path, {'min_date' : None, 'grain' : grain, 'layout' : 'sparse', 'rows' : size})
+
+def load_time_index(npy_path:str) -> tuple[numpy.ndarray, Union[pandas.Timestamp, None], str]:
+    """ Memory mapped time index, its first date (None on sparse indexes) and grain. """
+    with open(get_time_index_meta_path(npy_path), encoding = 'utf-8') as file:
+        meta = json.load(file)
+    if meta.get('layout') == 'sparse':
+        return numpy.load(npy_path, mmap_mode = 'r'), None, meta['grain']
+    return numpy.load(npy_path, mmap_mode = 'r'), pandas.Timestamp(meta['min_date']), meta['grain']
+
+def get_time_index_entries(npy_path:str, grain:str) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """ Sorted dates (int64 ns) and ids of the rows of a time index, of any layout. """
+    index, min_date, index_grain = load_time_index(npy_path)
+    if index_grain != grain:
+        raise ValueError(f'time index grain is {index_grain}, not {grain}')
+    if min_date is None:
+        return numpy.array(index[0]), numpy.array(index[1])
+    positions = numpy.flatnonzero(index >= 0)
+    dates = min_date.value + positions * pandas.Timedelta(TIME_GRAINS[grain]).value
+    return dates, index[positions].astype(numpy.int64)
+
+def lookup_time_ids(dates:pandas.Series, npy_path:str, grain:str) -> pandas.Series:
+    """ Time dimension ids for a column of dates, straight from the time index (missing as <NA>). """
+    index, min_date, index_grain = DIMENSION_KEYS.get(npy_path, 'time_index', load_time_index)
+    if index_grain != grain:
+        raise ValueError(f'time index grain is {index_grain}, not {grain}')
+
+    delta = pandas.Timedelta(TIME_GRAINS[grain])
+    dates = pandas.to_datetime(dates)
+    if min_date is None:
+        # sparse index, binary search over its sorted dates.
+        values = dates.dt.floor(delta).to_numpy(dtype = 'datetime64[ns]').view(numpy.int64)
+        positions = numpy.minimum(numpy.searchsorted(index[0], values), len(index[0]) - 1)
+        found = (len(index[0]) > 0) & dates.notna().to_numpy()
+        found[found] = index[0][positions[found]] == values[found]
+        result = numpy.full(len(values), -1, dtype = numpy.int32)
+        result[found] = index[1][positions[found]]
+    else:
+        positions = ((dates.dt.floor(delta) - min_date) // delta).fillna(-1).to_numpy(dtype = numpy.int64)
+        found = (positions >= 0) & (positions < len(index))
+        result = numpy.full(len(positions), -1, dtype = numpy.int32)
+        result[found] = index[positions[found]]
+
+    time_ids = pandas.array(result, dtype = 'Int32')
+    time_ids[result < 0] = pandas.NA
+    return pandas.Series(time_ids, index = dates.index)
 
 # translation tables
 INVALID_VOCALS:dict[int,int] = str.maketrans(
@@ -83,36 +733,973 @@ INVALID_VOCALS:dict[int,int] = str.maketrans(
 )
 
 
+# incremental loads state
+def to_json_value(value:Any) -> Any:
+    """ Plain python value (json serializable) from numpy / pandas scalars. """
+    if isinstance(value, pandas.Timestamp):
+        return str(value)
+    return value.item() if isinstance(value, numpy.generic) else value
+
+class StateStore:
+    """
+    Last surrogate id and high-water mark of every table, persisted as a local
+    json file between runs: {table_name : {'last_id': .., 'high_water_mark': ..}}
+    """
+
+    json_path: Union[str, None] = None
+    tables: dict = None
+
+    def __init__(self, json_path:str) -> None:
+        self.json_path = json_path
+        self.tables = {}
+        if os.path.exists(json_path):
+            with open(json_path, encoding = 'utf-8') as file:
+                self.tables = json.load(file)
+
+    def get(self, table_name:str) -> dict:
+        return self.tables.get(table_name, {})
+
+    def update(self, table_name:str, last_id:Any, high_water_mark:Any) -> None:
+        """ Updates a table state, saving the file atomically. """
+        self.tables[table_name] = {
+            'last_id'         : to_json_value(last_id),
+            'high_water_mark' : to_json_value(high_water_mark)
+        }
+        temp_path = self.json_path + '.tmp'
+        with open(temp_path, 'w', encoding = 'utf-8') as file:
+            json.dump(self.tables, file, indent = 4)
+        os.replace(temp_path, self.json_path)
+
+class KeyIndex:
+    """
+    Keys of the rows loaded into a table (64 bit hashes of their key columns)
+    as sorted .npy segments in a folder next to its output. Every load adds a
+    segment, merged with the previous ones while they aren't bigger (as a
+    binary counter, so every key is rewritten a logarithmic number of times).
+    Lookups memory map the segments and binary search them: they cost per
+    checked key, not per loaded row.
+    """
+
+    folder: Union[str, None] = None
+
+    def __init__(self, folder:str) -> None:
+        self.folder = folder
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.folder)
+
+    def get_segments(self) -> list[str]:
+        return sorted(glob.glob(os.path.join(self.folder, '*[0-9].npy')))
+
+    def contains(self, hashes:numpy.ndarray) -> numpy.ndarray:
+        """ Whether every hash was already added. """
+        found = numpy.zeros(len(hashes), dtype = bool)
+        for path in self.get_segments():
+            segment = numpy.load(path, mmap_mode = 'r')
+            if len(segment) == 0:
+                continue
+            positions = numpy.minimum(numpy.searchsorted(segment, hashes), len(segment) - 1)
+            found |= segment[positions] == hashes
+        return found
+
+    def write_segment(self, path:str, hashes:numpy.ndarray) -> None:
+        numpy.save(path + '.tmp.npy', hashes)
+        os.replace(path + '.tmp.npy', path)
+
+    def add(self, hashes:numpy.ndarray) -> None:
+        """ Adds the hashes of a load as a new segment, merging the smaller segments before it. """
+        os.makedirs(self.folder, exist_ok = True)
+        segments = self.get_segments()
+        number = int(os.path.basename(segments[-1])[:-4]) + 1 if segments else 0
+        merged = numpy.unique(numpy.asarray(hashes, dtype = numpy.uint64))
+        while segments:
+            previous = numpy.load(segments[-1], mmap_mode = 'r')
+            if len(previous) > 2 * len(merged):
+                break
+            # the merged segment replaces the previous one, taking its number.
+            merged = numpy.union1d(previous, merged)
+            number = int(os.path.basename(segments.pop())[:-4])
+        self.write_segment(os.path.join(self.folder, f'{number:08d}.npy'), merged)
+        for path in self.get_segments():
+            if int(os.path.basename(path)[:-4]) > number:
+                os.remove(path)
+
+    def clear(self) -> None:
+        shutil.rmtree(self.folder, ignore_errors = True)
+
+def get_key_index_path(output_path:str) -> str:
+    """ fact_invoices.csv -> fact_invoices.keys (folder of KeyIndex segments) """
+    return os.path.splitext(output_path)[0] + '.keys'
+
+
+# instrumentation
+class Metrics:
+    """
+    Per step metrics of every ETL (wall and cpu time, rows in and out, input
+    and written bytes, memory growth and peak while the step ran), kept in
+    memory and written as json lines.
+    """
+
+    jsonl_path: Union[str, None] = None
+    trace_memory: bool = False
+    records: list = None
+
+    def __init__(self, jsonl_path:Union[str, None] = None, trace_memory:bool = False) -> None:
+        self.jsonl_path = jsonl_path
+        self.trace_memory = trace_memory # tracemalloc is precise but slows python allocations.
+        self.records = []
+        self.run_id = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
+        self.lock = threading.Lock()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def record(self, **fields:Any) -> None:
+        fields = {key : to_json_value(value) for key, value in fields.items()}
+        fields['run_id'] = self.run_id
+        with self.lock:
+            self.records.append(fields)
+            if self.jsonl_path is not None:
+                with open(self.jsonl_path, 'a', encoding = 'utf-8') as file:
+                    file.write(json.dumps(fields) + '\n')
+
+    def reload(self) -> None:
+        """ Records of this run from the json lines file, e.g. written by other processes. """
+        if self.jsonl_path is not None and os.path.exists(self.jsonl_path):
+            with open(self.jsonl_path, encoding = 'utf-8') as file:
+                records = [json.loads(line) for line in file if line.strip()]
+            self.records = [record for record in records if record.get('run_id') == self.run_id]
+
+    def summary(self) -> pandas.DataFrame:
+        """ Totals per table and step (chunks of a streamed table are added up). """
+        if not self.records:
+            return pandas.DataFrame()
+        df = pandas.DataFrame(self.records)
+        return df.groupby(['table', 'step'], sort = False).agg(
+            calls         = ('wall_s', 'size'),
+            wall_s        = ('wall_s', 'sum'),
+            cpu_s         = ('cpu_s', 'sum'),
+            rows_in       = ('rows_in', 'sum'),
+            rows_out      = ('rows_out', 'sum'),
+            input_bytes   = ('input_bytes', 'sum'),
+            bytes_written = ('bytes_written', 'sum'),
+            rss_delta_mb  = ('rss_delta_mb', 'sum'),
+            peak_rss_mb   = ('peak_rss_mb', 'max'),
+            traced_mb     = ('traced_mb', 'max')
+        ).round(3)
+
+# None disables the instrumentation, see enable_metrics.
+METRICS: Union[Metrics, None] = None
+
+def enable_metrics(jsonl_path:Union[str, None] = None, trace_memory:bool = False) -> Metrics:
+    """ Turns on the ETL instrumentation for the whole process. """
+    global METRICS
+    METRICS = Metrics(jsonl_path = jsonl_path, trace_memory = trace_memory)
+    return METRICS
+
+def get_file_size(path:Any) -> int:
+    if isinstance(path, list) or (isinstance(path, str) and is_many_files(path)):
+        return sum(get_file_size(file) for file in get_input_files(path))
+    return os.path.getsize(path) if isinstance(path, str) and os.path.isfile(path) else 0
+
+def get_rows(data:Any) -> int:
+    return len(data) if isinstance(data, pandas.DataFrame) else 0
+
+def get_rss_mb() -> tuple[float, float]:
+    """
+    Current and peak resident memory of the process (MB). The peak is the one
+    since the last reset_peak_rss on linux, the whole process one elsewhere.
+    """
+    try:
+        with open('/proc/self/status', encoding = 'ascii') as file:
+            status = dict(line.split(':', 1) for line in file if ':' in line)
+        # reported in kilobytes.
+        return int(status['VmRSS'].split()[0]) / 1024, int(status['VmHWM'].split()[0]) / 1024
+    except (OSError, KeyError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return peak, peak
+
+def reset_peak_rss() -> None:
+    """ Starts measuring the peak resident memory again (linux only, a no-op elsewhere). """
+    try:
+        with open('/proc/self/clear_refs', 'w', encoding = 'ascii') as file:
+            file.write('5')
+    except OSError:
+        pass
+
+def get_children_cpu() -> float:
+    """ Cpu time of the finished child processes (e.g. partition workers). """
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def instrumented(method:Callable) -> Callable:
+    """ Records the metrics of an ETL step while the instrumentation is on. """
+    step = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        # super() calls of the same step are measured only once.
+        if METRICS is None or step in self._measured_steps:
+            return method(self, *args, **kwargs)
+
+        metrics = METRICS
+        self._measured_steps = self._measured_steps | {step}
+        rows_in = get_rows(self.data)
+        size_before = get_file_size(self.output_csv_path)
+        if metrics.trace_memory:
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+        # memory is process wide: tables running at the same time share it.
+        reset_peak_rss()
+        rss_before = get_rss_mb()[0]
+        wall, cpu, children_cpu = time.perf_counter(), time.thread_time(), get_children_cpu()
+        error = None
+        try:
+            return method(self, *args, **kwargs)
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            self._measured_steps = self._measured_steps - {step}
+            rss, peak_rss = get_rss_mb()
+            metrics.record(
+                etl           = f'{type(self).__module__}.{type(self).__name__}',
+                table         = self.table_name,
+                step          = step,
+                wall_s        = time.perf_counter() - wall,
+                # plus the workers of process pools, once they have finished.
+                cpu_s         = time.thread_time() - cpu + get_children_cpu() - children_cpu,
+                rows_in       = rows_in,
+                rows_out      = get_rows(self.data),
+                # whole input files, even when only some columns are parsed.
+                input_bytes   = get_file_size(self.input_csv_path) if step in ('extract', 'stream') else 0,
+                bytes_written = (
+                    max(get_file_size(self.output_csv_path) - size_before, 0)
+                    if self.is_appending()
+                    else get_file_size(self.output_csv_path)
+                ) if step in ('load', 'stream') else 0,
+                rss_delta_mb  = rss - rss_before,
+                peak_rss_mb   = peak_rss, # peak while the step ran.
+                traced_mb     = (
+                    (tracemalloc.get_traced_memory()[1] - traced_before) / 2 ** 20
+                    if metrics.trace_memory else None
+                ),
+                error         = error
+            )
+    return wrapper
+
+
+# build cache: outputs of previous runs, keyed by a hash of the input files,
+# the source code and the table parameters, so unchanged tables are restored.
+FILE_DIGESTS:dict[tuple, str] = {}
+
+def get_file_digest(path:str) -> Union[str, None]:
+    """ Content hash of a file (None when missing), computed once per file version. """
+    if not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in FILE_DIGESTS:
+        with open(path, 'rb') as file:
+            FILE_DIGESTS[key] = hashlib.file_digest(file, 'blake2b').hexdigest()
+    return FILE_DIGESTS[key]
+
+def get_code_version() -> str:
+    """ Hash of the ETL source files, any change on them invalidates every cached table. """
+    folder = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.blake2b()
+    for path in sorted(glob.glob(os.path.join(folder, '*.py'))):
+        digest.update(get_file_digest(path).encode('ascii'))
+    return digest.hexdigest()
+
+class BuildCache:
+    """
+    Copies of table outputs, one folder per cache key with an entry.json
+    (table, files, size and last use). Least recently used entries are
+    evicted once the cache is bigger than max_bytes.
+    """
+
+    directory: Union[str, None] = None
+    max_bytes: int = 0
+
+    def __init__(self, directory:str, max_bytes:int = 1024**3) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok = True)
+        self.evict()
+
+    def get_entries(self) -> list[tuple[str, dict]]:
+        entries = []
+        for entry_path in glob.glob(os.path.join(self.directory, '*', 'entry.json')):
+            try:
+                with open(entry_path, encoding = 'utf-8') as file:
+                    entries.append((os.path.dirname(entry_path), json.load(file)))
+            except (OSError, ValueError):
+                continue
+        return entries
+
+    def restore(self, key:str, output_paths:list[str]) -> bool:
+        """ Puts back the cached outputs of a key, returns False when there's no entry. """
+        folder = os.path.join(self.directory, key)
+        entry_path = os.path.join(folder, 'entry.json')
+        if not os.path.exists(entry_path):
+            return False
+        with open(entry_path, encoding = 'utf-8') as file:
+            entry = json.load(file)
+        if sorted(output['path'] for output in entry['outputs']) != sorted(output_paths):
+            return False
+
+        for output in entry['outputs']:
+            # outputs still on disk as they were restored / saved are left untouched.
+            stat = os.stat(output['path']) if os.path.exists(output['path']) else None
+            if stat is None or [stat.st_mtime_ns, stat.st_size] != output['stat']:
+                shutil.copyfile(os.path.join(folder, output['file']), output['path'])
+                stat = os.stat(output['path'])
+                output['stat'] = [stat.st_mtime_ns, stat.st_size]
+
+        entry['last_used'] = time.time()
+        self.write_entry(folder, entry)
+        return True
+
+    def store(self, key:str, table_name:str, output_paths:list[str]) -> None:
+        """ Copies the outputs of a successful table run under its key, then evicts old entries. """
+        folder = os.path.join(self.directory, key)
+        tmp_folder = folder + '.tmp'
+        shutil.rmtree(tmp_folder, ignore_errors = True)
+        os.makedirs(tmp_folder)
+
+        outputs = []
+        for number, path in enumerate(output_paths):
+            shutil.copyfile(path, os.path.join(tmp_folder, str(number)))
+            stat = os.stat(path)
+            outputs.append({'path' : path, 'file' : str(number), 'stat' : [stat.st_mtime_ns, stat.st_size]})
+
+        self.write_entry(tmp_folder, {
+            'table'     : table_name,
+            'outputs'   : outputs,
+            'size'      : sum(output['stat'][1] for output in outputs),
+            'last_used' : time.time()
+        })
+        shutil.rmtree(folder, ignore_errors = True)
+        os.replace(tmp_folder, folder)
+        self.evict()
+
+    @staticmethod
+    def write_entry(folder:str, entry:dict) -> None:
+        entry_path = os.path.join(folder, 'entry.json')
+        with open(entry_path + '.tmp', 'w', encoding = 'utf-8') as file:
+            json.dump(entry, file)
+        os.replace(entry_path + '.tmp', entry_path)
+
+    def evict(self) -> None:
+        """ Removes the least recently used entries until the cache fits on max_bytes. """
+        entries = sorted(self.get_entries(), key = lambda entry : entry[1]['last_used'])
+        size = sum(entry['size'] for folder, entry in entries)
+        for folder, entry in entries:
+            if size <= self.max_bytes:
+                break
+            shutil.rmtree(folder, ignore_errors = True)
+            size -= entry['size']
+
+    def invalidate(self, output_path:Union[str, None] = None) -> int:
+        """ Removes the entries saving an output file (every entry by default), returns how many. """
+        removed = 0
+        for folder, entry in self.get_entries():
+            if output_path is None or output_path in [output['path'] for output in entry['outputs']]:
+                shutil.rmtree(folder, ignore_errors = True)
+                removed += 1
+        return removed
+
+BUILD_CACHE: Union[BuildCache, None] = None
+
+def enable_build_cache(directory:str = '.etl_cache', max_bytes:int = 1024**3) -> BuildCache:
+    """ Turns on the build cache for every table run of the process. """
+    global BUILD_CACHE
+    BUILD_CACHE = BuildCache(directory = directory, max_bytes = max_bytes)
+    return BUILD_CACHE
+
+
+# SQL load target: tables written into a local database (duckdb when installed,
+# sqlite otherwise) next to their output files, created from their schemas.
+SQL_TYPES:dict[str, dict[str,str]] = {
+    'duckdb' : {
+        'int8' : 'TINYINT', 'int16' : 'SMALLINT', 'int32' : 'INTEGER', 'Int32' : 'INTEGER',
+        'int64' : 'BIGINT', 'Int64' : 'BIGINT', 'uint64' : 'UBIGINT',
+        'float32' : 'REAL', 'float64' : 'DOUBLE', 'bool' : 'BOOLEAN',
+        'datetime64[ns]' : 'TIMESTAMP', 'category' : 'VARCHAR'
+    },
+    # sqlite has no unsigned integers, uint64 values are kept as their int64 bits.
+    'sqlite' : {
+        'int8' : 'INTEGER', 'int16' : 'INTEGER', 'int32' : 'INTEGER', 'Int32' : 'INTEGER',
+        'int64' : 'INTEGER', 'Int64' : 'INTEGER', 'uint64' : 'INTEGER',
+        'float32' : 'REAL', 'float64' : 'REAL', 'bool' : 'INTEGER',
+        'datetime64[ns]' : 'TIMESTAMP', 'category' : 'TEXT'
+    }
+}
+SQL_MODES:list[str] = ['replace', 'upsert']
+
+# writes to the same database are serialized inside the process.
+SQL_LOCKS:dict[str, threading.Lock] = {}
+
+def get_default_sql_engine() -> str:
+    """ duckdb when installed (probed without importing it), sqlite otherwise. """
+    return 'duckdb' if importlib.util.find_spec('duckdb') is not None else 'sqlite'
+
+def get_sql_rows(dataframe:pandas.DataFrame) -> Iterator[tuple]:
+    """ Rows as python values for sqlite (dates as text, missing values as None). """
+    columns = []
+    for name, column in dataframe.items():
+        if pandas.api.types.is_datetime64_any_dtype(column):
+            column = column.dt.strftime('%Y-%m-%d %H:%M:%S')
+        elif column.dtype == 'uint64':
+            column = pandas.Series(column.to_numpy().view('int64'), index = column.index)
+        values = numpy.array(column.astype(object), dtype = object)
+        values[pandas.isna(values)] = None
+        columns.append(values)
+    return zip(*columns)
+
+class SqlTarget:
+    """
+    Local SQL warehouse (duckdb or sqlite file). Tables and indexes are created
+    from the table schemas; rows are inserted in bulk (a registered dataframe on
+    duckdb, batched executemany on sqlite) inside one transaction per write.
+    Full writes replace the table; appended rows are inserted ('replace' mode)
+    or upserted by natural key ('upsert' mode, reloading a batch is harmless).
+    """
+
+    path: Union[str, None] = None
+    engine: Union[str, None] = None
+    mode: str = 'replace'
+    batch_rows: int = 50_000
+
+    def __init__(
+            self, path:str, engine:Union[str, None] = None,
+            mode:str = 'replace', batch_rows:int = 50_000
+        ) -> None:
+        if mode not in SQL_MODES:
+            raise ValueError(f'unknown sql mode: {mode}')
+        self.path = path
+        self.engine = engine or get_default_sql_engine()
+        self.mode = mode
+        self.batch_rows = batch_rows
+
+    def connect(self) -> Any:
+        if self.engine == 'duckdb':
+            import duckdb
+            return duckdb.connect(self.path)
+        import sqlite3
+        return sqlite3.connect(self.path, timeout = 60, isolation_level = None)
+
+    def has_table(self, table:str) -> bool:
+        connection = self.connect()
+        try:
+            if self.engine == 'duckdb':
+                sql = 'SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?'
+            else:
+                sql = "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?"
+            return connection.execute(sql, [table]).fetchone()[0] > 0
+        finally:
+            connection.close()
+
+    def get_create_table(
+            self, table:str, schema:dict[str,str], columns:list[str], keys:Union[list[str], None]
+        ) -> str:
+        types = SQL_TYPES[self.engine]
+        definitions = [
+            f'{column} {types.get(schema.get(column), types["category"])}'
+            + (' PRIMARY KEY' if column == 'id' else '')
+            for column in columns
+        ]
+        if keys:
+            definitions.append(f'UNIQUE ({", ".join(keys)})')
+        return f'CREATE TABLE IF NOT EXISTS {table} ({", ".join(definitions)})'
+
+    def write(
+            self, table:str, dataframe:pandas.DataFrame, schema:Union[dict[str,str], None] = None,
+            keys:Union[list[str], None] = None, indexes:list[str] = [], append:bool = False,
+            mode:Union[str, None] = None
+        ) -> bool:
+        """ Writes rows of a table, replacing it unless they are appended (mode overrides the target one). """
+        schema = schema or {}
+        columns = list(dataframe.columns)
+        conflict = ''
+        if (mode or self.mode) == 'upsert' and append and keys:
+            updates = ', '.join(f'{column} = excluded.{column}' for column in columns if column not in keys)
+            conflict = f' ON CONFLICT ({", ".join(keys)}) DO ' + (f'UPDATE SET {updates}' if updates else 'NOTHING')
+
+        with SQL_LOCKS.setdefault(self.path, threading.Lock()):
+            connection = self.connect()
+            try:
+                connection.execute('BEGIN TRANSACTION')
+                if not append:
+                    connection.execute(f'DROP TABLE IF EXISTS {table}')
+                connection.execute(self.get_create_table(table, schema, columns, keys))
+                for column in indexes:
+                    connection.execute(f'CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})')
+
+                names = ', '.join(columns)
+                if self.engine == 'duckdb':
+                    # bulk path: duckdb scans the dataframe batches directly.
+                    for start in range(0, len(dataframe), self.batch_rows):
+                        connection.register('batch', dataframe.iloc[start:start + self.batch_rows])
+                        connection.execute(f'INSERT INTO {table} ({names}) SELECT {names} FROM batch{conflict}')
+                        connection.unregister('batch')
+                else:
+                    sql = f'INSERT INTO {table} ({names}) VALUES ({", ".join("?" * len(columns))}){conflict}'
+                    for start in range(0, len(dataframe), self.batch_rows):
+                        connection.executemany(sql, get_sql_rows(dataframe.iloc[start:start + self.batch_rows]))
+                connection.execute('COMMIT')
+                return True
+            except Exception as e:
+                connection.execute('ROLLBACK')
+                print(f'SqlTarget.write > {table} ERROR: ', str(e))
+                return False
+            finally:
+                connection.close()
+
+
 # generic ETL main class
 class ETL:
     """ Generic definitios for an ETL procedure with Pandas. """
 
-    input_csv_path: Union[str,None] = None
+    def __init_subclass__(cls, **kwargs) -> None:
+        # every table implementation gets its steps measured (see enable_metrics).
+        super().__init_subclass__(**kwargs)
+        for step in ('extract', 'transform', 'load'):
+            if step in cls.__dict__:
+                setattr(cls, step, instrumented(cls.__dict__[step]))
+
+    input_csv_path: Union[str, list[str], None] = None # a file, a glob pattern or a list of them.
     output_csv_path: Union[str,None] = None
     data: Union[pandas.DataFrame, None] = None
 
-    def __init__(self, input_csv_path, output_csv_path) -> bool:
+    # storage related, overridden by every table when needed.
+    input_columns: Union[list[str], None] = None # None reads every column.
+    input_schema: Union[dict[str,str], None] = None # {column : dtype}
+    output_schema: Union[dict[str,str], None] = None # {column : dtype}, applied before saving.
+    output_format: Union[str, None] = None # None picks it from the file extension, else it sets it.
+    # declared transform, {output column : source} (see build_frame), None when
+    # the table implements its own transform.
+    output_columns: Union[dict[str, Any], None] = None
+    chunk_size: Union[int, None] = None # rows per chunk, run() streams the table when set.
+    source_column: str = 'source_file' # file of every row, on inputs of many files.
+    read_workers: int = 8 # files read at the same time, on inputs of many files.
+    write_output: bool = True # False keeps the output only in memory (fused runs, see FrameStore).
+    sql_target: Union[SqlTarget, None] = None # when set, saved rows are also written there.
+    sql_keys: Union[list[str], None] = None # natural key of the table, for sql upserts.
+    sql_indexes: list[str] = [] # indexed columns of the sql table (e.g. foreign keys).
+    chunk_writer: Union[ChunkWriter, None] = None # streamed parquet / feather outputs.
+
+    # incremental loads related.
+    state: Union[StateStore, None] = None # None rebuilds the whole table.
+    table_name: Union[str, None] = None # key on the state store, the output file name.
+    watermark_column: Union[str, None] = None # input column used as high-water mark.
+    # input columns identifying the rows: rows up to the mark (more rows of its
+    # day, late ones) are new while their key isn't on the table key index.
+    watermark_key: Union[list[str], None] = None
+    last_state: dict = {}
+    high_water_mark: Any = None
+    new_keys: Union[numpy.ndarray, None] = None # key hashes of the rows being loaded.
+    _measured_steps: frozenset = frozenset()
+
+    def __init__(
+            self, input_csv_path, output_csv_path,
+            state:Union[StateStore, None] = None
+        ) -> bool:
         self.input_csv_path = input_csv_path
-        self.output_csv_path = output_csv_path
+        # every reader picks the format from the extension.
+        self.output_csv_path = (
+            get_format_path(output_csv_path, self.output_format)
+            if isinstance(output_csv_path, str) else output_csv_path
+        )
+        self.state = state
+        self.table_name = os.path.splitext(os.path.basename(str(self.output_csv_path)))[0]
         return (
             True 
-            if isinstance(self.input_csv_path, str)
+            if isinstance(self.input_csv_path, (str, list))
             and isinstance(self.output_csv_path, str)
             else False
         )
     
     def extract(self) -> bool:
-        self.data = get_data(csv_path = self.input_csv_path)
+        if is_many_files(self.input_csv_path):
+            self.data = get_many_data(
+                input_path = self.input_csv_path,
+                columns = self.input_columns,
+                schema = self.input_schema,
+                source_column = self.source_column,
+                max_workers = self.read_workers
+            )
+        else:
+            self.data = get_data(
+                csv_path = self.input_csv_path,
+                columns = self.input_columns,
+                schema = self.input_schema
+            )
+        self.filter_new_rows()
         return True if isinstance(self.data, pandas.DataFrame) else False
+
+    def filter_new_rows(self) -> None:
+        """
+        Incremental mode (a state store was given): keeps only the rows newer than
+        the table high-water mark, plus the older ones whose key isn't loaded yet
+        (see watermark_key), and continues the surrogate id sequence.
+        """
+        if self.state is None or not isinstance(self.data, pandas.DataFrame):
+            return
+        self.last_state = self.state.get(self.table_name)
+        self.high_water_mark = self.last_state.get('high_water_mark')
+
+        if self.watermark_column is not None:
+            newer = numpy.ones(len(self.data), dtype = bool)
+            if self.high_water_mark is not None:
+                newer = (self.data[self.watermark_column] > self.high_water_mark).to_numpy()
+            new = newer.copy()
+            if self.watermark_key is not None:
+                hashes = get_row_hashes(self.data, self.watermark_key)
+                key_index = KeyIndex(get_key_index_path(self.output_csv_path))
+                if not self.last_state:
+                    # first incremental load, keys of an older one are stale.
+                    key_index.clear()
+                    self.new_keys = hashes
+                elif key_index.exists():
+                    # only the rows up to the mark are looked up.
+                    new[~newer] = ~key_index.contains(hashes[~newer])
+                    self.new_keys = hashes[new]
+                else:
+                    # loaded before keeping keys: the rows up to the mark were
+                    # loaded (the previous rule), they are indexed with the new ones.
+                    self.new_keys = hashes
+            if newer.any():
+                # late rows never move the mark back.
+                self.high_water_mark = self.data[self.watermark_column][newer].max()
+            self.data = self.data[new]
+
+        if self.last_state.get('last_id') is not None and getattr(self, 'starting_id', None) is not None:
+            self.starting_id = self.last_state['last_id'] + 1
+
+    def is_appending(self) -> bool:
+        """ Incremental mode with a previous load: new rows go after the existing ones. """
+        return bool(self.state is not None and self.last_state and os.path.exists(self.output_csv_path))
+
+    def save_state(self, last_id:Any) -> None:
+        """ Incremental mode: persists the last surrogate id, high-water mark and loaded keys. """
+        if self.state is not None:
+            if self.new_keys is not None:
+                KeyIndex(get_key_index_path(self.output_csv_path)).add(self.new_keys)
+                self.new_keys = None
+            self.state.update(self.table_name, last_id, self.high_water_mark)
     
-    # defined inside implementation eventually.
-    def transform(self) -> bool: ...
+    def get_output_columns(self) -> Union[dict[str, Any], None]:
+        """ Declared output columns of the current data, overridden when they depend on it. """
+        return self.output_columns
+
+    def transform(self) -> bool:
+        """
+        Builds the output frame from the declared columns in one step, without
+        copying the input (surrogate ids first on tables with a starting_id).
+        Tables without a declaration implement their own transform.
+        """
+        columns = self.get_output_columns()
+        if columns is None:
+            return False
+        self.data = build_frame(self.data, columns, getattr(self, 'starting_id', None))
+        return True
 
     def load(self) -> bool:
-        result = save_data(
-            dataframe = self.data,
-            csv_path = self.output_csv_path
-        )
+        # incremental mode appends the new rows (when there are some) after a first full load.
+        append = self.is_appending()
+        if append and len(self.data) == 0:
+            return True
+
+        self.data = apply_schema(self.data, self.output_schema)
+        result = self.save(self.data, append = append)
+        if result and 'id' in self.data.columns and len(self.data) > 0:
+            self.save_state(last_id = self.data['id'].max())
         return result
 
+    def save(self, dataframe:pandas.DataFrame, append:bool = False) -> bool:
+        """ Saves rows of the table to its output file, and to the sql target when there's one. """
+        # outputs nobody reads in memory are always written.
+        kept = FRAMES is not None and FRAMES.put(self.output_csv_path, dataframe, append = append)
+        result = True
+        if self.chunk_writer is not None:
+            result = self.chunk_writer.write(dataframe)
+        elif self.write_output or not kept:
+            result = save_data(
+                dataframe = dataframe,
+                csv_path = self.output_csv_path,
+                append = append,
+                storage_format = self.output_format
+            )
+        if result and self.sql_target is not None:
+            result = self.sql_target.write(
+                table     = self.table_name,
+                dataframe = dataframe,
+                schema    = self.output_schema,
+                keys      = self.sql_keys,
+                indexes   = self.sql_indexes,
+                append    = append
+            )
+        return result
+
+    def get_table_paths(self) -> list[str]:
+        """ Files holding the rows of the table. """
+        return [self.output_csv_path]
+
+    def get_output_paths(self) -> list[str]:
+        """ Files written by the table, the ones kept by the build cache. """
+        return self.get_table_paths()
+
+    def backfill_sql(self) -> bool:
+        """ Loads the rows saved by previous runs into a sql target that doesn't have the table yet. """
+        if self.sql_target.has_table(self.table_name):
+            return True
+        append = False
+        for path in self.get_table_paths():
+            if not os.path.exists(path):
+                continue
+            header = get_data(csv_path = path, nrows = 0)
+            if header is None or not set(self.output_schema or []).issubset(header.columns):
+                # older layout, the run rebuilds it.
+                continue
+            df = get_data(csv_path = path, schema = self.output_schema)
+            if df is None or not self.sql_target.write(
+                    self.table_name, df, self.output_schema, self.sql_keys, self.sql_indexes, append
+                ):
+                return False
+            append = True
+        return True
+
+    def get_dependency_paths(self) -> list[str]:
+        """ Files read besides the input (e.g. dimensions), part of the build cache key. """
+        return []
+
+    def get_stale_paths(self) -> list[str]:
+        """ Files that must not be left next to restored outputs (e.g. other partitions). """
+        return []
 
+    def get_cache_key(self) -> str:
+        """ Hash of the input and dependency files, the source code and the table parameters. """
+        parameters = {
+            name : value for name, value in sorted(vars(self).items())
+            if isinstance(value, (str, int, float, bool, list, tuple, type(None)))
+        }
+        files = get_input_files(self.input_csv_path) + self.get_dependency_paths()
+        key = {
+            'table'      : f'{type(self).__module__}.{type(self).__name__}',
+            'code'       : get_code_version(),
+            'parameters' : parameters,
+            'files'      : [(path, get_file_digest(path)) for path in files]
+        }
+        return hashlib.blake2b(json.dumps(key, default = str).encode('utf-8'), digest_size = 20).hexdigest()
+
+    def run(self) -> bool:
+        """
+        Runs the whole ETL, streaming it when the table has a chunk size, and
+        returns False when any step failed. With the build cache on, a table
+        whose inputs, code and parameters match a previous run gets its
+        outputs restored instead (full loads only).
+        """
+        try:
+            # the sql target and in memory outputs aren't restored, those tables always run.
+            cache = BUILD_CACHE if self.state is None and self.sql_target is None and FRAMES is None else None
+            if cache is not None:
+                key = self.get_cache_key()
+                if cache.restore(key, self.get_output_paths()):
+                    for path in self.get_stale_paths():
+                        os.remove(path)
+                    print(f'{type(self).__name__}.run > cached')
+                    return True
+
+            if self.sql_target is not None and not self.backfill_sql():
+                return False
+
+            if self.chunk_size:
+                result = self.stream(chunk_size = self.chunk_size)
+            else:
+                # every step reports its result, a failed one stops the run.
+                result = bool(self.extract() and self.transform() and self.load())
+
+            # only successful runs are stored: the outputs of a failed one would
+            # be restored by later runs, even once the failure is fixed.
+            if cache is not None and result is True and all(os.path.exists(path) for path in self.get_output_paths()):
+                cache.store(key, self.table_name, self.get_output_paths())
+            return result
+        except Exception as e:
+            print(f'{type(self).__name__}.run >>>', str(e))
+            return False
+
+    @instrumented
+    def stream(self, chunk_size:int) -> bool:
+        """
+        Runs the whole ETL over fixed-size chunks of the input, appending every
+        transformed chunk to the output. Memory is bounded by the chunk size, so
+        it only fits transforms that are local to each row. Parquet and feather
+        outputs are written through one arrow writer (see ChunkWriter).
+        """
+        try:
+            append = False
+            storage_format = get_storage_format(self.output_csv_path, self.output_format)
+            if storage_format != 'csv' and (self.write_output or FRAMES is None):
+                self.chunk_writer = ChunkWriter(self.output_csv_path, storage_format)
+            if is_many_files(self.input_csv_path):
+                chunks = get_many_data_chunks(
+                    input_path = self.input_csv_path,
+                    chunk_size = chunk_size,
+                    schema = self.input_schema,
+                    source_column = self.source_column
+                )
+            else:
+                chunks = get_data_chunks(
+                    csv_path = self.input_csv_path,
+                    chunk_size = chunk_size,
+                    schema = self.input_schema
+                )
+            for chunk in chunks:
+                self.data = chunk if self.input_columns is None else chunk[self.input_columns]
+                if not self.transform():
+                    return False
+                self.data = apply_schema(self.data, self.output_schema)
+
+                if not self.save(self.data, append = append):
+                    return False
+                append = True
+
+                # keeping surrogate keys contiguous across chunks.
+                if getattr(self, 'starting_id', None) is not None:
+                    self.starting_id += len(self.data)
+
+            self.data = None
+            return True
+        except Exception as e:
+            print('stream >>>', str(e))
+            return False
+        finally:
+            if self.chunk_writer is not None:
+                self.chunk_writer.close()
+                self.chunk_writer = None
+
+
+# slowly changing dimensions (type 2)
+SCD_COLUMNS:dict[str,str] = {
+    'row_hash'   : 'uint64',
+    'valid_from' : 'datetime64[ns]',
+    'valid_to'   : 'datetime64[ns]', # empty while the version is current.
+    'is_current' : 'bool'
+}
+# first version of every key, valid for any earlier fact (e.g. late invoices).
+SCD_START:pandas.Timestamp = pandas.Timestamp('1900-01-01')
+
+def get_row_hashes(dataframe:pandas.DataFrame, columns:list[str]) -> numpy.ndarray:
+    """ One 64 bit hash per row of the given columns, to detect changed rows. """
+    return pandas.util.hash_pandas_object(dataframe[columns], index = False).to_numpy()
+
+def merge_versions(
+        current:Union[pandas.DataFrame, None], incoming:pandas.DataFrame,
+        natural_key:str, attributes:list[str], starting_id:int, timestamp:pandas.Timestamp
+    ) -> tuple[pandas.DataFrame, numpy.ndarray]:
+    """
+    Type 2 merge of a snapshot into the current versions of a dimension
+    (id, natural key, row_hash): returns the versions to add (new keys and
+    changed ones) and the ids of the versions they replace. Unchanged rows
+    produce nothing.
+    """
+    row_hashes = get_row_hashes(incoming, attributes)
+
+    if current is None or len(current) == 0:
+        new_key = numpy.ones(len(incoming), dtype = bool)
+        changed = ~new_key
+        replaced_ids = numpy.empty(0, dtype = numpy.int64)
+    else:
+        key_index = pandas.Index(current[natural_key])
+        positions = key_index.get_indexer(incoming[natural_key])
+        new_key = positions < 0
+        current_hashes = current['row_hash'].to_numpy()[positions]
+        changed = ~new_key & (current_hashes != row_hashes)
+        replaced_ids = current['id'].to_numpy()[positions[changed]]
+
+    rows = new_key | changed
+    versions = build_frame(incoming[rows], {
+        **{column : column for column in incoming.columns},
+        'row_hash'           : row_hashes[rows],
+        'valid_from'         : numpy.where(new_key[rows], SCD_START.to_datetime64(), timestamp.to_datetime64()),
+        'valid_to'           : pandas.NaT,
+        'is_current'         : True,
+        'ingestion_date'     : timestamp,
+        'last_modified_date' : timestamp
+    }, starting_id)
+    return versions, replaced_ids
+
+class SlowlyChangingDimension(ETL):
+    """
+    Dimension kept as type 2 versions: every run hashes the attributes of the
+    snapshot rows, compares them with the current versions and only adds the
+    new and changed ones (valid_from / valid_to / is_current).
+    """
+
+    natural_key: Union[str, None] = None
+    attributes: Union[list[str], None] = None # None hashes every column but the natural key.
+    starting_id: Union[int, None] = None
+    replaced_ids: Union[numpy.ndarray, None] = None
+    rebuild: bool = False
+
+    def get_current_versions(self) -> Union[pandas.DataFrame, None]:
+        """ id, natural key and row hash of the current versions (None without a type 2 output). """
+        if not os.path.exists(self.output_csv_path):
+            return None
+        header = get_data(csv_path = self.output_csv_path, nrows = 0)
+        if header is None or not set(SCD_COLUMNS).issubset(header.columns):
+            # built before keeping versions, rebuilt once.
+            return None
+        df = get_data(
+            csv_path = self.output_csv_path,
+            columns  = ['id', self.natural_key, 'row_hash', 'is_current'],
+            schema   = SCD_COLUMNS
+        )
+        if df is None:
+            return None
+        # ids keep growing after the last version.
+        self.starting_id = max(self.starting_id, int(df['id'].max()) + 1 if len(df) else 0)
+        return df[df['is_current']]
+
+    def get_dependency_paths(self) -> list[str]:
+        # new versions depend on the current ones.
+        return [self.output_csv_path]
+
+    def transform(self) -> bool:
+        current = self.get_current_versions()
+        self.rebuild = current is None
+        attributes = self.attributes or [column for column in self.data.columns if column != self.natural_key]
+        self.data, self.replaced_ids = merge_versions(
+            current     = current,
+            incoming    = self.data,
+            natural_key = self.natural_key,
+            attributes  = attributes,
+            starting_id = self.starting_id,
+            timestamp   = RUN_TIMESTAMP
+        )
+        return True
+
+    def load(self) -> bool:
+        """
+        Appends the new versions; only when versions were replaced the file
+        is rewritten to close them. Nothing is written when nothing changed.
+        """
+        if self.rebuild:
+            result = self.save(self.data)
+        elif len(self.replaced_ids) > 0:
+            df = get_data(csv_path = self.output_csv_path, schema = self.output_schema)
+            replaced = df['id'].isin(self.replaced_ids)
+            df.loc[replaced, 'valid_to'] = RUN_TIMESTAMP
+            df.loc[replaced, 'is_current'] = False
+            df.loc[replaced, 'last_modified_date'] = RUN_TIMESTAMP
+            df = apply_schema(pandas.concat([df, self.data], ignore_index = True), self.output_schema)
+            result = self.save(df)
+        elif len(self.data) > 0:
+            result = self.save(self.data, append = True)
+        else:
+            result = True
+
+        if result and len(self.data) > 0:
+            self.save_state(last_id = self.data['id'].max())
+        return result
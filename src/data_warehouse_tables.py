@@ -1,160 +1,416 @@
+import bisect
+import glob
+import io
+import json
+import os
+import sys
+import numpy
 import pandas
-import random
-from datetime import datetime
-from typing import Union, List
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterator, Union, List
 import core
+import mock_data
+import stagging_tables
+
+# dimension files used by the fact table for resolving surrogate keys.
+DIMENSION_PATHS:dict[str,str] = {
+    'time'           : "docs/output_data_warehouse/time_dim.csv",
+    'customer'       : "docs/output_data_warehouse/customers_dim.csv",
+    'product'        : "docs/output_data_warehouse/products_dim.csv",
+    'payment_method' : "docs/output_data_warehouse/payment_method_dim.csv"
+}
+# time dimension ids as a memory mapped array, written with the time dimension.
+TIME_INDEX_PATH:str = "docs/output_data_warehouse/time_dim.index.npy"
+
+# summary tables maintained with the fact table: {name : (path, keys)}
+ROLLUPS:dict[str, tuple[str, List[str]]] = {
+    'sales_product_quarter'    : (
+        "docs/output_data_warehouse/sales_product_quarter.csv",
+        ['product_id', 'year', 'quarter']
+    ),
+    # by natural key: every version of a customer adds to the same rows.
+    'sales_customer_month'     : (
+        "docs/output_data_warehouse/sales_customer_month.csv",
+        ['customer_id', 'year', 'month']
+    ),
+    'sales_payment_method_day' : (
+        "docs/output_data_warehouse/sales_payment_method_day.csv",
+        ['payment_method_id', 'year', 'month', 'day']
+    )
+}
+# one row per invoice, referenced by the fact lines through invoice_id.
+INVOICE_HEADERS_PATH:str = "docs/output_data_warehouse/fact_invoice_headers.csv"
+
+ROLLUP_MEASURES:dict[str, tuple[str, str]] = {
+    'lines'            : ('total_per_product', 'size'),
+    'product_quantity' : ('product_quantity', 'sum'),
+    'total_sales'      : ('total_per_product', 'sum')
+}
+
+# declared dtypes of the warehouse tables (see stagging_tables.SCHEMAS), used
+# when saving them and when they are read back as dimensions.
+METADATA_SCHEMA:dict[str,str] = {
+    'ingestion_date'     : 'datetime64[ns]',
+    'last_modified_date' : 'datetime64[ns]'
+}
+SCHEMAS:dict[str, dict[str,str]] = {
+    'customers_dim'      : {
+        **stagging_tables.SCHEMAS['customers'],
+        'id' : 'int32',
+        **core.SCD_COLUMNS,
+        **METADATA_SCHEMA
+    },
+    'products_dim'       : {
+        **stagging_tables.SCHEMAS['products'],
+        'id' : 'int32',
+        **core.SCD_COLUMNS,
+        **METADATA_SCHEMA
+    },
+    'time_dim'           : {
+        'id'                 : 'int32',
+        'date'               : 'datetime64[ns]',
+        'year'               : 'int16',
+        'quarter'            : 'int8',
+        'semester'           : 'int8',
+        'month'              : 'int8',
+        'month_string'       : 'category',
+        'day'                : 'int8',
+        'day_of_week_string' : 'category',
+        'hour_24'            : 'int8',
+        'hour_12'            : 'int8',
+        'minutes'            : 'int8',
+        'seconds'            : 'int8',
+        'max_date_ingested'  : 'datetime64[ns]',
+        'min_date_ingested'  : 'datetime64[ns]',
+        **METADATA_SCHEMA
+    },
+    'payment_method_dim' : {
+        'id'                : 'int32',
+        'payment_method_id' : 'int32',
+        'method'            : 'category',
+        **METADATA_SCHEMA
+    },
+    'fact_invoices'      : {
+        'id'                : 'int32',
+        'invoice_id'        : 'int32',
+        # missing dimension rows are kept as <NA>.
+        'time_id'           : 'Int32',
+        'customer_id'       : 'Int32',
+        'product_id'        : 'Int32',
+        'payment_method_id' : 'Int32',
+        'product_quantity'  : 'int32',
+        'total_per_product' : 'float64',
+        'currency_type'     : 'category',
+        **METADATA_SCHEMA
+    },
+    'fact_invoice_headers' : {
+        'invoice_id'        : 'int32',
+        'time_id'           : 'Int32',
+        'customer_id'       : 'Int32',
+        'payment_method_id' : 'Int32',
+        'first_product_id'  : 'Int32',
+        'line_count'        : 'int32',
+        'item_quantity'     : 'int64',
+        'total_invoice'     : 'float64',
+        'currency_type'     : 'category',
+        **METADATA_SCHEMA
+    }
+}
+
+def read_table(name:str, columns:Union[List[str], None] = None) -> Union[pandas.DataFrame, None]:
+    """ A warehouse table (single file, not partitioned) read back with its declared dtypes. """
+    return core.get_data(
+        csv_path = f'docs/output_data_warehouse/{name}.csv',
+        columns  = columns,
+        schema   = SCHEMAS[name]
+    )
 
-class Customer(core.ETL):
-    starting_id: Union[int, None] = None
+# last surrogate ids and high-water marks of every table, for incremental loads.
+STATE_PATH:str = "docs/output_data_warehouse/etl_state.json"
+
+class Customer(core.SlowlyChangingDimension):
+    input_schema = stagging_tables.SCHEMAS['customers']
+    output_schema = SCHEMAS['customers_dim']
+    natural_key = 'customer_id' # versions are kept by natural key (type 2).
+    sql_keys = ['customer_id', 'valid_from']
 
-    def __init__(self, input_csv_path, output_csv_path, starting_id:int) -> bool:
-        super().__init__(input_csv_path, output_csv_path)
+    def __init__(
+            self, input_csv_path, output_csv_path, starting_id:int,
+            state:Union[core.StateStore, None] = None
+        ) -> bool:
+        super().__init__(input_csv_path, output_csv_path, state)
         self.starting_id = starting_id
 
-    def extract(self) -> None: 
+    def extract(self) -> bool: 
         result = super().extract()
         print('Customer.extract > ', str(result))
+        return result
 
-    def transform(self) -> None:
+    def transform(self) -> bool:
         try:
-            df = self.data.copy()
-            
-            
-            today = str(datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S"))
-
-            df['ingestion_date'] = today
-            df['last_modified_date'] = today
-
-            # inserting ids for the dimension on the datawarehouse.
-            df = core.insert_ids(
-                dataframe = df,
-                starting_id = self.starting_id
-            )
-
-            self.data = df
-            print('Customer.transform > True')
+            # only new customers and changed ones become new versions.
+            result = super().transform()
+            print('Customer.transform > ', str(result))
+            return result
         except Exception as e:
             print('Customer.transform > ERROR: ', str(e))
+            return False
 
-    def load(self) -> None: 
+    def load(self) -> bool: 
         result = super().load()
         print('Customer.load > ', str(result))
-
-class Product(core.ETL):
-    starting_id: Union[int, None] = None
-
-    def __init__(self, input_csv_path, output_csv_path, starting_id:int) -> bool:
-        super().__init__(input_csv_path, output_csv_path)
+        return result
+
+class Product(core.SlowlyChangingDimension):
+    input_schema = stagging_tables.SCHEMAS['products']
+    output_schema = SCHEMAS['products_dim']
+    natural_key = 'product_id' # versions are kept by natural key (type 2).
+    sql_keys = ['product_id', 'valid_from']
+    sql_indexes = ['category']
+
+    def __init__(
+            self, input_csv_path, output_csv_path, starting_id:int,
+            state:Union[core.StateStore, None] = None
+        ) -> bool:
+        super().__init__(input_csv_path, output_csv_path, state)
         self.starting_id = starting_id
 
-    def extract(self) -> None: 
+    def extract(self) -> bool: 
         result = super().extract()
         print('Product.extract > ', str(result))
+        return result
 
-    def transform(self) -> None:
+    def transform(self) -> bool:
         try:
-            df = self.data.copy()
-            
-            today = str(datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S"))
-
-            df['ingestion_date'] = today
-            df['last_modified_date'] = today
-
-            # inserting ids for the dimension on the datawarehouse.
-            df = core.insert_ids(
-                dataframe = df,
-                starting_id = self.starting_id
-            )
-            
-            self.data = df
-            print('Product.transform > True')
+            # only new products and changed ones become new versions.
+            result = super().transform()
+            print('Product.transform > ', str(result))
+            return result
         except Exception as e:
             print('Product.transform > ERROR: ', str(e))
+            return False
 
-    def load(self) -> None: 
+    def load(self) -> bool: 
         result = super().load()
         print('Product.load > ', str(result))
+        return result
 
 class Time(core.ETL):
+    input_columns = ['invoice_date'] # the only column needed from the invoices.
+    input_schema = {'invoice_date' : 'datetime64[ns]'}
+    output_schema = SCHEMAS['time_dim']
+    # no high-water mark: late invoices can fall before the dimension.
+    sql_keys = ['date']
+    sql_indexes = ['year', 'month']
     starting_id: Union[int, None] = None
-    def __init__(self, input_csv_path, output_csv_path, starting_id:int) -> bool:
-        super().__init__(input_csv_path, output_csv_path)
+    grain: str = 'day'
+    chunk_rows: Union[int, None] = None
+    calendar: Union[Iterator[pandas.DataFrame], None] = None
+    index_path: Union[str, None] = None
+    sparse: bool = False
+    padding: int = 0
+    merging: bool = False
+
+    def __init__(
+            self, input_csv_path, output_csv_path, starting_id:int,
+            grain:str = 'day', chunk_rows:Union[int, None] = None,
+            state:Union[core.StateStore, None] = None,
+            index_path:Union[str, None] = None,
+            sparse:bool = False, padding:int = 0
+        ) -> bool:
+        super().__init__(input_csv_path, output_csv_path, state)
         self.starting_id = starting_id
-
-    def extract(self) -> None: 
+        self.grain = grain # one of core.TIME_GRAINS.
+        self.chunk_rows = chunk_rows # when set, the calendar is expanded lazily on load.
+        self.index_path = index_path # time index (.npy) saved with the dimension, when set.
+        # only the dates found on the invoices (plus padding grains around each
+        # one) instead of the whole range, merged into the existing dimension.
+        self.sparse = sparse
+        self.padding = padding
+
+    def extract(self) -> bool: 
         result = super().extract()
         print('Time.extract > ', str(result))
+        return result
 
-    def transform(self) -> None:
+    def transform(self) -> bool:
         try:
-            df = self.data.copy()
+            df = self.data
 
-            # 1 - obtaining first and last dates from the invoices.
-
-            df = df[['invoice_date']]
-            # getting only date part of the whole string.
-            df['invoice_date'] = df['invoice_date'].map(lambda x : x[:10])
-            # making it a sorted list with unique values.
-            dates:List = df['invoice_date'].unique().tolist()
-            dates.sort()
-            # get first and last items.
-            dates = [dates[0], dates[-1]]
+            # nothing new to add (incremental mode).
+            if len(df) == 0:
+                self.data = df
+                print('Time.transform > True')
+                return True
 
-            # 2 - Calculating whole time dimension,
+            if self.sparse:
+                self.data = self.get_new_dates(df['invoice_date'])
+                print('Time.transform > True')
+                return True
 
-            start_date = pandas.Timestamp(dates[0])
-            end_date = pandas.Timestamp(dates[1])
-
-            time_range = pandas.date_range(
-                start = start_date,
-                end   = end_date,
-                freq  = "1min" # frequence down to 1 min due to file size limitation.
-            )
-
-            time_df = pandas.DataFrame(data = {'date' : time_range})
-
-            time_df['year'] = time_df['date'].dt.year
-            time_df['quarter'] = time_df['date'].dt.quarter
-            time_df['semester'] = time_df['date'].dt.month.map(core.get_semester)
-            time_df['month'] = time_df['date'].dt.month
-            time_df['month_string'] = time_df['date'].dt.month.map(core.get_month_name)
-            time_df['day'] = time_df['date'].dt.day
-            time_df['day_of_week_string'] = time_df['date'].dt.day_of_week.map(core.get_week_day_name)
-            time_df['hour_24'] = time_df['date'].dt.hour
-            time_df['hour_12'] = time_df['date'].dt.hour.map(lambda x : abs(x - 12))
-            time_df['minutes'] = time_df['date'].dt.minute
-            time_df['seconds'] = time_df['date'].dt.second
-            time_df['max_date_ingested'] = dates[1]
-            time_df['min_date_ingested'] = dates[0]
-
-            today = str(datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S"))
-
-            time_df['ingestion_date'] = today
-            time_df['last_modified_date'] = today
-
-            # inserting ids for the dimension on the datawarehouse.
-            time_df = core.insert_ids(
-                dataframe = time_df,
-                starting_id = self.starting_id
-            )
+            # 1 - obtaining first and last dates from the invoices.
 
-            self.data = time_df
+            delta = pandas.Timedelta(core.TIME_GRAINS[self.grain])
+            invoice_dates = df['invoice_date']
+            # from the first day up to the grain of the last invoice.
+            dates:List = [invoice_dates.min().normalize(), invoice_dates.max().floor(delta)]
+            ranges = [(dates[0], dates[1])]
+            starting_id = self.starting_id
+
+            # incremental mode, only the grains before the first date (late
+            # invoices) and after the last one of the dimension are added, so
+            # it stays a contiguous range and the time index a dense array.
+            if self.is_appending():
+                existing_dates, existing_ids = self.get_existing_dates()
+                if len(existing_dates) > 0:
+                    first, last = pandas.Timestamp(existing_dates[0]), pandas.Timestamp(existing_dates[-1])
+                    ranges = [(dates[0], first - delta), (last + delta, dates[1])]
+                    ranges = [(start, end) for start, end in ranges if start <= end]
+                    starting_id = max(starting_id, int(existing_ids.max()) + 1)
+            if not ranges:
+                # the new invoices fall on grains the dimension already has.
+                self.data = df.iloc[:0]
+                print('Time.transform > True')
+                return True
+
+            # 2 - Calculating whole time dimension, at the requested grain.
+
+            def add_metadata(time_df:pandas.DataFrame) -> pandas.DataFrame:
+                time_df['max_date_ingested'] = dates[1]
+                time_df['min_date_ingested'] = dates[0]
+                time_df['ingestion_date'] = core.RUN_TIMESTAMP
+                time_df['last_modified_date'] = core.RUN_TIMESTAMP
+                return time_df
+
+            def iter_ranges() -> Iterator[pandas.DataFrame]:
+                range_id = starting_id
+                for start, end in ranges:
+                    yield from core.iter_calendar(
+                        start_date  = start,
+                        end_date    = end,
+                        grain       = self.grain,
+                        starting_id = range_id,
+                        chunk_rows  = self.chunk_rows or 1_000_000
+                    )
+                    range_id += (end - start) // delta + 1
+
+            calendar = map(add_metadata, iter_ranges())
+
+            if self.chunk_rows:
+                self.data = None
+                self.calendar = calendar
+            else:
+                self.data = pandas.concat(calendar, ignore_index = True)
             print('Time.transform > True')
+            return True
         except Exception as e:
             print('Time.transform > ERROR: ', str(e))
-
-    def load(self) -> None: 
-        result = super().load()
+            return False
+
+    def get_new_dates(self, invoice_dates:pandas.Series) -> pandas.DataFrame:
+        """
+        Sparse mode: rows for the distinct invoice dates (at the grain, plus the
+        padding) that the dimension doesn't have yet. Dates are sorted int64
+        arrays: the new ones are found with binary searches over the existing
+        ones, so the cost grows with the batch rather than with the history.
+        """
+        delta = pandas.Timedelta(core.TIME_GRAINS[self.grain])
+        floored = invoice_dates.dropna().dt.floor(delta)
+        dates = numpy.unique(floored.to_numpy(dtype = 'datetime64[ns]').view(numpy.int64))
+        if self.padding:
+            offsets = numpy.arange(-self.padding, self.padding + 1) * delta.value
+            dates = numpy.unique((dates[:, None] + offsets).ravel())
+
+        existing_dates, existing_ids = self.get_existing_dates()
+        self.merging = len(existing_dates) > 0
+        positions = numpy.searchsorted(existing_dates, dates)
+        known = positions < len(existing_dates)
+        known[known] = existing_dates[positions[known]] == dates[known]
+        new_dates = dates[~known]
+        starting_id = max(self.starting_id, int(existing_ids.max()) + 1 if self.merging else 0)
+
+        time_df = core.get_calendar(pandas.Series(new_dates.view('datetime64[ns]')), starting_id)
+        time_df['max_date_ingested'] = floored.max()
+        time_df['min_date_ingested'] = floored.min()
+        time_df['ingestion_date'] = core.RUN_TIMESTAMP
+        time_df['last_modified_date'] = core.RUN_TIMESTAMP
+        return time_df
+
+    def get_existing_dates(self) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """ Sorted dates (int64 ns) and ids already on the dimension, from its index when there's one. """
+        empty = numpy.empty(0, dtype = numpy.int64)
+        if not os.path.exists(self.output_csv_path):
+            return empty, empty
+        if self.index_path is not None and os.path.exists(self.index_path):
+            return core.get_time_index_entries(self.index_path, self.grain)
+        df = core.get_data(csv_path = self.output_csv_path, columns = ['id', 'date'], schema = SCHEMAS['time_dim'])
+        df = df.sort_values('date')
+        return df['date'].to_numpy(dtype = 'datetime64[ns]').view(numpy.int64), df['id'].to_numpy(dtype = numpy.int64)
+
+    def get_dependency_paths(self) -> List[str]:
+        # sparse dimensions grow from the existing one.
+        return [self.output_csv_path] if self.sparse else []
+
+    def is_appending(self) -> bool:
+        # new sparse dates go after the existing ones, incremental or not.
+        return super().is_appending() or self.merging
+
+    def load(self) -> bool: 
+        append = self.is_appending()
+        if self.calendar is None:
+            result = super().load()
+            if result and len(self.data) > 0:
+                self.save_index(self.data, append)
+        else:
+            result = True
+            for time_df in self.calendar:
+                result = self.save(core.apply_schema(time_df, self.output_schema), append = append)
+                if not result:
+                    break
+                self.save_index(time_df, append)
+                append = True
+                self.save_state(last_id = time_df['id'].max())
+            self.calendar = None
         print('Time.load > ', str(result))
+        return result
+
+    def get_output_paths(self) -> List[str]:
+        if self.index_path is None:
+            return [self.output_csv_path]
+        return [self.output_csv_path, self.index_path, core.get_time_index_meta_path(self.index_path)]
+
+    def save_index(self, time_df:pandas.DataFrame, append:bool) -> None:
+        """ Adds the saved rows to the time index (a missing one is built from the whole file). """
+        if self.index_path is None:
+            return
+        if append and not os.path.exists(self.index_path):
+            get_time_index(self.grain, self.output_csv_path, self.index_path)
+        elif self.sparse:
+            core.save_sparse_time_index(self.index_path, time_df['date'], time_df['id'], self.grain, append)
+        else:
+            core.save_time_index(self.index_path, time_df['date'], time_df['id'], self.grain, append)
 
 class PaymentMethod(core.ETL):
+    output_schema = SCHEMAS['payment_method_dim']
+    watermark_column = 'payment_method_id'
+    sql_keys = ['payment_method_id']
+    output_columns = {
+        'payment_method_id'  : 'payment_method_id',
+        'method'             : 'method',
+        'description'        : 'description',
+        'ingestion_date'     : core.RUN_TIMESTAMP,
+        'last_modified_date' : core.RUN_TIMESTAMP
+    }
     starting_id: Union[int, None] = None
 
-    def __init__(self, input_csv_path, output_csv_path, starting_id:int) -> bool:
-        super().__init__(input_csv_path, output_csv_path)
+    def __init__(
+            self, input_csv_path, output_csv_path, starting_id:int,
+            state:Union[core.StateStore, None] = None
+        ) -> bool:
+        super().__init__(input_csv_path, output_csv_path, state)
         self.starting_id = starting_id
 
-    def extract(self) -> None: 
+    def extract(self) -> bool: 
         # OVERRIDING EXISTING ETL METHOD, there's no provided data.
         #result = super().extract()
 
@@ -180,233 +436,790 @@ class PaymentMethod(core.ETL):
                 'description':'the last one, finally.'
             }
         ])
+        self.filter_new_rows()
         
         print('PaymentMethod.extract > True')
+        return True
 
-    def transform(self) -> None:
+    def transform(self) -> bool:
         try:
-            df = self.data.copy()
-
-            today = str(datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S"))
-
-            df['ingestion_date'] = today
-            df['last_modified_date'] = today
-
-            # inserting ids for the dimension on the datawarehouse.
-            df = core.insert_ids(
-                dataframe = df,
-                starting_id = self.starting_id
-            )
-
-            
-            self.data = df
-            print('PaymentMethod.transform > True')
+            result = super().transform()
+            print('PaymentMethod.transform > ', str(result))
+            return result
         except Exception as e:
             print('PaymentMethod.transform > ERROR: ', str(e))
+            return False
 
-    def load(self) -> None: 
+    def load(self) -> bool: 
         result = super().load()
         print('PaymentMethod.load > ', str(result))
+        return result
+
+def build_fact_invoices(dataframe:pandas.DataFrame, starting_id:int, time_grain:str) -> pandas.DataFrame:
+    """
+    Fact invoices rows from the staging invoices, resolving every dimension id.
+    Every column is computed from the invoices and the frame assembled once.
+    """
+    invoice_dates = pandas.to_datetime(dataframe['invoice_date'], format = "%Y-%m-%d")
+    # since we dont have payment_methods_id, we mock them (seeded, one per invoice)
+    payment_methods = pandas.Series(
+        mock_data.get_choices([1111, 2222, 3333, 4444], keys = dataframe['invoice_id'], salt = 'payment_method'),
+        index = dataframe.index
+    )
 
-class Invoice(core.ETL):
-    starting_id: Union[int, None] = None
+    return core.build_frame(dataframe, {
+        'invoice_id'         : 'invoice_id',
+        # time ids, straight from the memory mapped time index (no parsing nor merging).
+        'time_id'            : core.lookup_time_ids(
+            dates    = invoice_dates,
+            npy_path = get_time_index(time_grain),
+            grain    = time_grain
+        ),
+        # customer and product ids, of the versions valid at the invoice date.
+        'customer_id'        : core.DIMENSION_KEYS.lookup_as_of(
+            DIMENSION_PATHS['customer'], 'customer_id', dataframe['client_id'], invoice_dates
+        ),
+        'product_id'         : core.DIMENSION_KEYS.lookup_as_of(
+            DIMENSION_PATHS['product'], 'product_id', dataframe['product_id'], invoice_dates
+        ),
+        # payment_method ids, from the cached key map.
+        'payment_method_id'  : core.DIMENSION_KEYS.lookup(
+            DIMENSION_PATHS['payment_method'], 'payment_method_id', payment_methods
+        ),
+        'product_quantity'   : 'product_quantity',
+        # ammount of the whole invoice is on its header (see build_invoice_headers).
+        'total_per_product'  : 'total_invoice',
+        'currency_type'      : 'currency_type',
+        'ingestion_date'     : core.RUN_TIMESTAMP,
+        'last_modified_date' : core.RUN_TIMESTAMP
+    }, starting_id)
+
+def get_time_index(
+        grain:str, csv_path:str = DIMENSION_PATHS['time'], npy_path:str = TIME_INDEX_PATH
+    ) -> str:
+    """
+    Path of the time index, built once from the time dimension file when
+    missing (older builds): sparse when the dimension covers less than half
+    of its date range, dense otherwise.
+    """
+    if not os.path.exists(npy_path):
+        df_time = core.get_data(
+            csv_path = csv_path,
+            columns  = ['id', 'date'],
+            schema   = SCHEMAS['time_dim']
+        )
+        span = (df_time['date'].max() - df_time['date'].min()) // pandas.Timedelta(core.TIME_GRAINS[grain]) + 1
+        if len(df_time) > 0 and span > 2 * len(df_time):
+            core.save_sparse_time_index(npy_path, df_time['date'], df_time['id'], grain)
+        else:
+            core.save_time_index(npy_path, df_time['date'], df_time['id'], grain)
+    return npy_path
+
+def get_calendar_table() -> pandas.DataFrame:
+    """ Date parts of every time id (cached until the time dimension changes). """
+    return core.DIMENSION_KEYS.get(
+        csv_path = DIMENSION_PATHS['time'],
+        name     = 'calendar',
+        loader   = lambda path : core.get_data(
+            csv_path = path,
+            columns  = ['id', 'date', 'year', 'quarter', 'month', 'day'],
+            schema   = SCHEMAS['time_dim']
+        ).set_index('id')
+    )
 
-    def __init__(self, input_csv_path, output_csv_path, starting_id:int) -> bool:
-        super().__init__(input_csv_path, output_csv_path)
-        self.starting_id = starting_id
+def get_fact_dates(time_ids:pandas.Series) -> pandas.Series:
+    """ Date of every fact row, from its time id (NaT when unknown). """
+    return pandas.Series(
+        get_calendar_table()['date'].reindex(time_ids).to_numpy(),
+        index = time_ids.index
+    )
 
-    def extract(self) -> None: 
-        result = super().extract()
-        print('Invoice.extract > ', str(result))
+def get_natural_keys(version_ids:pandas.Series, csv_path:str, natural_key:str) -> pandas.Series:
+    """ Natural key of every version id of a type 2 dimension, <NA> when unknown (cached). """
+    keys = core.DIMENSION_KEYS.get(
+        csv_path = csv_path,
+        name     = 'natural_keys:' + natural_key,
+        loader   = lambda path : core.get_data(
+            csv_path = path, columns = ['id', natural_key]
+        ).set_index('id')[natural_key].astype('Int64')
+    )
+    return pandas.Series(keys.reindex(version_ids).to_numpy(), index = version_ids.index)
+
+def build_rollups(fact:pandas.DataFrame) -> dict[str, pandas.DataFrame]:
+    """ Rollups (see ROLLUPS) of a batch of fact rows, to be merged into the existing ones. """
+    df = fact[[
+        'time_id', 'customer_id', 'product_id', 'payment_method_id',
+        'product_quantity', 'total_per_product'
+    ]].join(get_calendar_table()[['year', 'quarter', 'month', 'day']], on = 'time_id')
+    df['customer_id'] = get_natural_keys(fact['customer_id'], DIMENSION_PATHS['customer'], 'customer_id')
+
+    return {
+        name : core.aggregate(df, keys, ROLLUP_MEASURES)
+        for name, (path, keys) in ROLLUPS.items()
+    }
+
+def merge_rollups(
+        rollups:Union[dict[str, pandas.DataFrame], None],
+        deltas:dict[str, pandas.DataFrame]
+    ) -> dict[str, pandas.DataFrame]:
+    """ Adds the rollups of another batch (e.g. another partition). """
+    if rollups is None:
+        return deltas
+    return {
+        name : core.merge_aggregates(rollups[name], deltas[name], keys)
+        for name, (path, keys) in ROLLUPS.items()
+    }
+
+def load_rollups(rollups:dict[str, pandas.DataFrame], incremental:bool) -> bool:
+    """
+    Saves the rollups. Incremental loads merge the new batch into the saved
+    rollups instead of rebuilding them from the fact table.
+    """
+    result = True
+    for name, (path, keys) in ROLLUPS.items():
+        df = rollups[name]
+        if incremental and os.path.exists(path):
+            existing = core.get_data(csv_path = path, schema = {key : 'Int64' for key in keys})
+            df = core.merge_aggregates(existing, df, keys)
+        result = core.save_data(df, path) and result
+    return result
+
+# header columns taken from the first line of every invoice: {header column : line column}
+HEADER_FIRSTS:dict[str,str] = {
+    'time_id'            : 'time_id',
+    'customer_id'        : 'customer_id',
+    'payment_method_id'  : 'payment_method_id',
+    'first_product_id'   : 'product_id',
+    'currency_type'      : 'currency_type',
+    'ingestion_date'     : 'ingestion_date'
+}
+# header columns reduced over the lines (or the headers of every batch): {header column : ufunc}
+HEADER_REDUCTIONS:dict[str, numpy.ufunc] = {
+    'line_count'         : numpy.add,
+    'item_quantity'      : numpy.add,
+    'total_invoice'      : numpy.add,
+    'last_modified_date' : numpy.maximum
+}
+
+def reduce_invoices(
+        dataframe:pandas.DataFrame, firsts:dict[str,str], values:dict[str, numpy.ndarray]
+    ) -> pandas.DataFrame:
+    """
+    One sort based pass over the rows grouped by invoice_id: the first row of
+    every invoice (rows keep their order inside an invoice) and the given
+    values reduced per invoice (see HEADER_REDUCTIONS), nothing merged back.
+    """
+    invoice_ids = dataframe['invoice_id'].to_numpy()
+    order = numpy.argsort(invoice_ids, kind = 'stable')
+    invoice_ids = invoice_ids[order]
+    starts = numpy.flatnonzero(numpy.concatenate([[True], invoice_ids[1:] != invoice_ids[:-1]]))[:len(order)]
+    first = dataframe.iloc[order[starts]].reset_index(drop = True)
+    return core.build_frame(first, {
+        'invoice_id' : 'invoice_id',
+        **firsts,
+        **{
+            name : HEADER_REDUCTIONS[name].reduceat(column[order], starts) if len(starts) else column[:0]
+            for name, column in values.items()
+        }
+    })[list(SCHEMAS['fact_invoice_headers'])]
+
+def build_invoice_headers(fact:pandas.DataFrame) -> pandas.DataFrame:
+    """ Headers (totals, line count, item quantity, first product) of a batch of fact lines. """
+    return reduce_invoices(fact, HEADER_FIRSTS, {
+        'line_count'         : numpy.ones(len(fact), dtype = numpy.int32),
+        'item_quantity'      : fact['product_quantity'].to_numpy(dtype = numpy.int64),
+        'total_invoice'      : fact['total_per_product'].to_numpy(dtype = numpy.float64),
+        'last_modified_date' : fact['last_modified_date'].to_numpy()
+    })
+
+def merge_invoice_headers(
+        headers:Union[pandas.DataFrame, None], deltas:pandas.DataFrame
+    ) -> pandas.DataFrame:
+    """
+    Adds the headers of another batch (partition, chunk or incremental load):
+    sums are added, an invoice keeps the first line of its earliest batch and
+    the last modification date of its latest one.
+    """
+    if headers is None:
+        return deltas
+    df = pandas.concat([headers, deltas], ignore_index = True)
+    return reduce_invoices(
+        df,
+        {column : column for column in HEADER_FIRSTS},
+        {column : df[column].to_numpy() for column in HEADER_REDUCTIONS}
+    )
 
-    def transform(self) -> None:
-        try:
-            df = self.data.copy()
-        
-            df['invoice_date'] = df['invoice_date'].map(
-                lambda x : datetime.strftime(
-                    datetime.strptime(x, "%Y-%m-%d"),
-                    "%Y-%m-%d %H:%M:%S"
-                )
-            )
-            # since we dont have payment_methods_id, we create them randomly
-            df['payment_method_id'] = df['invoice_id'].map(
-                lambda x : random.choice(
-                    [1111, 2222, 3333, 4444]
+def load_invoice_headers(
+        headers:pandas.DataFrame, incremental:bool,
+        sql_target:Union[core.SqlTarget, None] = None
+    ) -> bool:
+    """
+    Saves the headers. Incremental loads append the headers of new invoices
+    (found on the headers key index); only when some lines are late (their
+    invoice is already saved) the file is rewritten, chunk by chunk, merging
+    them. The sql table gets just the appended and merged rows, upserted.
+    """
+    schema = SCHEMAS['fact_invoice_headers']
+    headers = core.apply_schema(headers, schema)
+    hashes = core.get_row_hashes(headers, ['invoice_id'])
+    key_index = core.KeyIndex(core.get_key_index_path(INVOICE_HEADERS_PATH))
+    append = incremental and os.path.exists(INVOICE_HEADERS_PATH)
+
+    if not append:
+        key_index.clear()
+        saved = numpy.zeros(len(headers), dtype = bool)
+        changed = headers
+        result = core.save_data(headers, INVOICE_HEADERS_PATH)
+    else:
+        if not key_index.exists():
+            # saved before keeping keys, indexed once from the file.
+            invoice_ids = core.get_data(csv_path = INVOICE_HEADERS_PATH, columns = ['invoice_id'], schema = schema)
+            key_index.add(core.get_row_hashes(invoice_ids, ['invoice_id']))
+        saved = key_index.contains(hashes)
+        changed = headers[~saved]
+        result = core.save_data(changed, INVOICE_HEADERS_PATH, append = True)
+        if result and saved.any():
+            merged = merge_saved_invoice_headers(headers[saved])
+            result = merged is not None
+            changed = pandas.concat([changed, merged], ignore_index = True) if result else changed
+
+    if result:
+        key_index.add(hashes[~saved])
+    if result and sql_target is not None:
+        result = sql_target.write(
+            'fact_invoice_headers', changed, schema, ['invoice_id'], ['time_id', 'customer_id'],
+            append = append, mode = 'upsert' if append else None
+        )
+    return result
+
+def merge_saved_invoice_headers(late:pandas.DataFrame) -> Union[pandas.DataFrame, None]:
+    """ Rewrites the saved headers chunk by chunk, merging the late ones; returns the merged headers. """
+    schema = SCHEMAS['fact_invoice_headers']
+    root, extension = os.path.splitext(INVOICE_HEADERS_PATH)
+    temporary_path = f'{root}.tmp{extension}'
+    merged = []
+    append = False
+    for chunk in core.get_data_chunks(INVOICE_HEADERS_PATH, core.CSV_BLOCK_ROWS, schema):
+        rows = chunk['invoice_id'].isin(late['invoice_id']).to_numpy()
+        if rows.any():
+            merged.append(merge_invoice_headers(chunk[rows], late[late['invoice_id'].isin(chunk['invoice_id'])]))
+            chunk = pandas.concat([chunk[~rows], merged[-1]], ignore_index = True)
+        if not core.save_data(core.apply_schema(chunk, schema), temporary_path, append = append):
+            return None
+        append = True
+    os.replace(temporary_path, INVOICE_HEADERS_PATH)
+    return core.apply_schema(pandas.concat(merged, ignore_index = True) if merged else late.iloc[:0], schema)
+
+def build_fact_partition(
+        dataframe:pandas.DataFrame, starting_id:int, time_grain:str,
+        part_path:str, append:bool, storage_format:Union[str, None]
+    ) -> tuple[int, dict[str, pandas.DataFrame], pandas.DataFrame]:
+    """ Builds and saves one partition of the fact table, returns its rows, rollups and headers. """
+    df = core.apply_schema(build_fact_invoices(dataframe, starting_id, time_grain), SCHEMAS['fact_invoices'])
+    append = append and os.path.exists(part_path)
+    if not core.save_data(df, part_path, append = append, storage_format = storage_format):
+        raise IOError(f'could not save {part_path}')
+    return len(df), build_rollups(df), build_invoice_headers(df)
+
+def get_part_path(output_path:str, partition:Union[int, str]) -> str:
+    """ fact_invoices.csv -> fact_invoices.part-00000.csv ('*' gives a glob pattern) """
+    root, extension = os.path.splitext(output_path)
+    partition = partition if isinstance(partition, str) else f'{partition:05d}'
+    return f'{root}.part-{partition}{extension}'
+
+def remove_files(paths:List[str], keep:List[str] = []) -> None:
+    """ Removes stale outputs, e.g. part files left by a differently partitioned build. """
+    for path in paths:
+        if path not in keep and os.path.exists(path):
+            os.remove(path)
+
+# fact table layouts besides a single file or hash partitions.
+FACT_LAYOUTS:List[str] = ['month']
+UNDATED_PARTITION:str = 'undated'
+
+def get_manifest_path(output_path:str) -> str:
+    """ fact_invoices.csv -> fact_invoices.manifest.json """
+    return os.path.splitext(output_path)[0] + '.manifest.json'
+
+def load_manifest(manifest_path:str) -> Union[dict, None]:
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding = 'utf-8') as file:
+        return json.load(file)
+
+def save_manifest(manifest_path:str, manifest:dict) -> None:
+    """ Replaces the manifest at once, readers never see a partial one. """
+    with open(manifest_path + '.tmp', 'w', encoding = 'utf-8') as file:
+        json.dump(manifest, file, indent = 4)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+def get_row_offsets(csv_path:str, start:int, header:bool) -> numpy.ndarray:
+    """ Byte offset of every line of a csv file written from start (skipping the header line). """
+    with open(csv_path, 'rb') as file:
+        file.seek(start)
+        data = numpy.frombuffer(file.read(), dtype = numpy.uint8)
+    ends = numpy.flatnonzero(data == ord('\n')) + 1 + start
+    offsets = numpy.concatenate([[start], ends[:-1]])
+    return offsets[1:] if header else offsets
+
+def get_bound_text(value:Any) -> Union[str, int, None]:
+    """ Partition bounds as json values: ids as ints, dates as iso text (sorted like the dates). """
+    if pandas.isna(value):
+        return None
+    return str(value) if isinstance(value, pandas.Timestamp) else int(value)
+
+def save_fact_month(
+        dataframe:pandas.DataFrame, dates:pandas.Series, part_path:str,
+        entry:Union[dict, None], storage_format:Union[str, None]
+    ) -> dict:
+    """
+    Saves the rows of one month partition (sorted by date and id) and returns
+    its manifest entry. Rows after the end of the partition are appended to
+    it, earlier ones (late invoices) rewrite the whole partition.
+    """
+    csv = core.get_storage_format(part_path, storage_format) == 'csv'
+    append = (
+        entry is not None and csv and os.path.exists(part_path)
+        and (entry['max_date'] is None or dates.min() >= pandas.Timestamp(entry['max_date']))
+    )
+    if entry is not None and not append:
+        existing = core.get_data(csv_path = part_path, schema = SCHEMAS['fact_invoices'], storage_format = storage_format)
+        dataframe = pandas.concat([existing, dataframe], ignore_index = True)
+        dates = get_fact_dates(dataframe['time_id'])
+        order = numpy.lexsort((dataframe['id'].to_numpy(), dates.to_numpy().view('int64')))
+        dataframe, dates = dataframe.take(order), dates.take(order)
+        entry = None
+
+    start = os.path.getsize(part_path) if append else 0
+    if not core.save_data(dataframe, part_path, append = append, storage_format = storage_format):
+        raise IOError(f'could not save {part_path}')
+
+    # first row (and its byte offset on csv files) of every day, readers seek to them.
+    days = dates.dt.floor('D').dt.strftime('%Y-%m-%d').to_numpy()
+    rows = numpy.flatnonzero(numpy.concatenate([[True], days[1:] != days[:-1]]))
+    offsets = entry['offsets'] if entry is not None else []
+    if offsets and len(rows) > 0 and offsets[-1][0] == days[0]:
+        rows = rows[1:]
+    row_bytes = get_row_offsets(part_path, start, header = not append) if csv else None
+    base = entry['rows'] if entry is not None else 0
+    offsets = offsets + [
+        [days[row], base + int(row), None if row_bytes is None else int(row_bytes[row])]
+        for row in rows if isinstance(days[row], str)
+    ]
+
+    bounds = {
+        'min_date'    : get_bound_text(dates.min()),
+        'max_date'    : get_bound_text(dates.max()),
+        'min_time_id' : get_bound_text(dataframe['time_id'].min()),
+        'max_time_id' : get_bound_text(dataframe['time_id'].max()),
+        'min_id'      : get_bound_text(dataframe['id'].min()),
+        'max_id'      : get_bound_text(dataframe['id'].max())
+    }
+    if entry is not None:
+        # appended rows, the bounds also cover the previous ones.
+        for name, value in bounds.items():
+            values = [v for v in [entry[name], value] if v is not None]
+            bounds[name] = (min if name.startswith('min') else max)(values) if values else None
+    return {
+        'path'        : part_path,
+        'rows'        : base + len(dataframe),
+        'bytes'       : os.path.getsize(part_path),
+        **bounds,
+        'offsets'     : offsets
+    }
+
+
+def read_fact_month(
+        entry:dict, start_date:Union[pandas.Timestamp, None], end_date:Union[pandas.Timestamp, None],
+        columns:Union[List[str], None]
+    ) -> pandas.DataFrame:
+    """ Rows of one month partition, only the bytes between the days covering the range on csv files. """
+    schema = SCHEMAS['fact_invoices']
+    offsets = entry['offsets']
+    if core.get_storage_format(entry['path']) != 'csv' or not offsets or offsets[0][2] is None:
+        return core.get_data(csv_path = entry['path'], columns = columns, schema = schema)
+
+    days = [day for day, row, offset in offsets]
+    first, last = 0, len(offsets)
+    if start_date is not None:
+        # the last day starting before the range (the first one of the range on day grains).
+        first = max(bisect.bisect_right(days, start_date.strftime('%Y-%m-%d')) - 1, 0)
+    if end_date is not None:
+        last = bisect.bisect_left(days, end_date.strftime('%Y-%m-%d'), lo = first)
+        last += int(last < len(days) and pandas.Timestamp(days[last]) < end_date)
+    start = offsets[first][2]
+    stop = offsets[last][2] if last < len(offsets) else entry['bytes']
+
+    with open(entry['path'], 'rb') as file:
+        header = file.readline()
+        file.seek(start)
+        data = file.read(stop - start)
+    df = pandas.read_csv(
+        io.BytesIO(header + data),
+        usecols = columns,
+        **core.get_csv_options(schema, columns)
+    )
+    return core.apply_schema(df, schema)
+
+def read_fact_invoices(
+        start_date:Union[str, pandas.Timestamp, None] = None,
+        end_date:Union[str, pandas.Timestamp, None] = None,
+        columns:Union[List[str], None] = None,
+        output_path:str = "docs/output_data_warehouse/fact_invoices.csv"
+    ) -> Union[pandas.DataFrame, None]:
+    """
+    Fact rows dated in [start_date, end_date). With the month layout only the
+    partitions overlapping the range are read (see the manifest), other
+    layouts read every fact file and filter it.
+    """
+    start_date = None if start_date is None else pandas.Timestamp(start_date)
+    end_date = None if end_date is None else pandas.Timestamp(end_date)
+    read_columns = None if columns is None else list(dict.fromkeys(columns + ['time_id']))
+    try:
+        manifest = load_manifest(get_manifest_path(output_path))
+        if manifest is not None:
+            frames = [
+                read_fact_month(entry, start_date, end_date, read_columns)
+                for key, entry in sorted(manifest['partitions'].items())
+                if (start_date is None and end_date is None) or (
+                    entry['min_date'] is not None
+                    and (start_date is None or pandas.Timestamp(entry['max_date']) >= start_date)
+                    and (end_date is None or pandas.Timestamp(entry['min_date']) < end_date)
                 )
-            )
-
-            # Calculating the ammount of the whole invoice (detail could be spread across more than one row.)
-
-            df = df.rename(columns = {'total_invoice' : 'total_per_product'})
-            
-            df_total_invoice = df.groupby('invoice_id')['total_per_product'].sum().to_frame()
-
-            df_total_invoice = df_total_invoice.rename(
-                columns = {'total_per_product' : 'total_invoice'}
-            )
-
-            df = df.merge(df_total_invoice, on='invoice_id', how='left')
-            
-
-
-            # get id's for inserting new data.
-
-            # time ids
-            df_time = core.get_data(
-                csv_path = "docs/output_data_warehouse/time_dim.csv"
-            )
-
-            # since client data only haves date data, we trunc the dataset only to those
-            # columns wich doesnt have temporal data. (faster)
-            
-            df_time = df_time.loc[
-                (df_time['hour_24'] == 0) &
-                (df_time['minutes'] == 0) &
-                (df_time['seconds'] == 0)
             ]
-            df_time = df_time[['id', 'date']]
-            df_time = df_time.rename(columns = {
-                'id' : 'time_dim_id', # new field in fact_invoice
-                'date' : 'invoice_date' # field existing inside fact_invoice.
-            })
-
-            
-            # customer ids
-            df_customer = core.get_data(
-                csv_path = "docs/output_data_warehouse/customers_dim.csv"
-            )
-            df_customer = df_customer[['id', 'customer_id']]
-            df_customer = df_customer.rename(
-                columns = {
-                    'id' : 'customer_dim_id',
-                    'customer_id': 'client_id'
-                }
-            )
+        else:
+            paths = [output_path] if os.path.exists(output_path) else sorted(glob.glob(get_part_path(output_path, '*')))
+            frames = [core.get_data(csv_path = path, columns = read_columns, schema = SCHEMAS['fact_invoices']) for path in paths]
+        if not frames:
+            frames = [core.apply_schema(
+                pandas.DataFrame(columns = read_columns or list(SCHEMAS['fact_invoices'])),
+                SCHEMAS['fact_invoices']
+            )]
+
+        df = pandas.concat(frames, ignore_index = True)
+        if start_date is not None or end_date is not None:
+            dates = get_fact_dates(df['time_id'])
+            mask = dates.notna()
+            if start_date is not None:
+                mask &= dates >= start_date
+            if end_date is not None:
+                mask &= dates < end_date
+            df = df[mask.to_numpy()].reset_index(drop = True)
+        return df if columns is None else df[columns]
+    except Exception as e:
+        print('read_fact_invoices >>>', str(e))
+        return None
 
 
-            # product ids
-            df_product = core.get_data(
-                csv_path = "docs/output_data_warehouse/products_dim.csv"
-            )
-            df_product = df_product[['id', 'product_id']]
-            df_product = df_product.rename(
-                columns = {'id' : 'product_dim_id'}
-            )
+class Invoice(core.ETL):
+    input_schema = stagging_tables.SCHEMAS['invoices']
+    output_schema = SCHEMAS['fact_invoices']
+    watermark_column = 'invoice_date'
+    # lines dated up to the mark (late ones, other files of its day) are still
+    # loaded once, while their invoice line isn't on the fact key index.
+    watermark_key = ['invoice_id', 'product_id']
+    # an invoice has every product once (see validation_tables.RULES).
+    sql_keys = ['invoice_id', 'product_id']
+    sql_indexes = ['time_id', 'customer_id', 'product_id', 'payment_method_id']
+    starting_id: Union[int, None] = None
+    time_grain: str = 'day'
+    partitions: Union[int, None] = None
+    max_workers: Union[int, None] = None
+    part_paths: Union[List[str], None] = None
+    part_rows: int = 0
+    layout: Union[str, None] = None
+    rollups: Union[dict[str, pandas.DataFrame], None] = None
+    headers: Union[pandas.DataFrame, None] = None
+
+    def __init__(
+            self, input_csv_path, output_csv_path, starting_id:int,
+            time_grain:str = 'day', state:Union[core.StateStore, None] = None,
+            partitions:Union[int, None] = None, max_workers:Union[int, None] = None,
+            layout:Union[str, None] = None
+        ) -> bool:
+        super().__init__(input_csv_path, output_csv_path, state)
+        if layout is not None and layout not in FACT_LAYOUTS:
+            raise ValueError(f'unknown fact layout: {layout}')
+        if layout is not None and partitions:
+            raise ValueError('the month layout is saved in one process, without hash partitions')
+        self.starting_id = starting_id
+        self.time_grain = time_grain # must match the grain of the time dimension.
+        self.partitions = partitions # when set, built on a process pool as part files.
+        self.max_workers = max_workers
+        self.layout = layout # 'month': one part file per month of the invoices, sorted by date.
 
+    def extract(self) -> bool: 
+        result = super().extract()
+        print('Invoice.extract > ', str(result))
+        return result
 
-            # payment_method ids
-            df_payment_method = core.get_data(
-                csv_path = "docs/output_data_warehouse/payment_method_dim.csv"
-            )
-            df_payment_method = df_payment_method[['id', 'payment_method_id']]
-            df_payment_method = df_payment_method.rename(
-                columns = {'id' : 'payment_method_dim_id'}
+    def transform(self) -> bool:
+        try:
+            if self.partitions:
+                self.transform_partitions()
+            else:
+                self.data = build_fact_invoices(self.data, self.starting_id, self.time_grain)
+                self.rollups = build_rollups(self.data)
+                self.headers = build_invoice_headers(self.data)
+            print('Invoice.transform > True')
+            return True
+        except Exception as e:
+            print('Invoice.transform > ERROR: ', str(e))
+            return False
+
+    def transform_partitions(self) -> None:
+        """
+        Hash-partitions the invoices by invoice_id (so every invoice total stays
+        inside one partition) and builds every partition on a process pool,
+        each one saved as a part file. Surrogate ids stay contiguous and
+        deterministic: every partition gets its range from the partition sizes.
+        """
+        df = self.data
+        # built here when missing, so the workers only map it.
+        get_time_index(self.time_grain)
+        # hashes are uint64, numpy.bincount only takes signed ids.
+        partition_ids = (pandas.util.hash_array(df['invoice_id'].to_numpy()) % self.partitions).astype(numpy.intp)
+        sizes = numpy.bincount(partition_ids, minlength = self.partitions)
+        offsets = self.starting_id + numpy.concatenate([[0], numpy.cumsum(sizes)[:-1]])
+        order = numpy.argsort(partition_ids, kind = 'stable')
+        append = bool(self.state is not None and self.last_state)
+
+        with ProcessPoolExecutor(max_workers = self.max_workers) as executor:
+            futures = []
+            for partition, rows in enumerate(numpy.split(order, numpy.cumsum(sizes)[:-1])):
+                futures.append(executor.submit(
+                    build_fact_partition,
+                    df.iloc[rows],
+                    int(offsets[partition]),
+                    self.time_grain,
+                    get_part_path(self.output_csv_path, partition),
+                    append,
+                    self.output_format
+                ))
+            rows_written = 0
+            for future in futures:
+                rows, rollups, headers = future.result()
+                rows_written += rows
+                self.rollups = merge_rollups(self.rollups, rollups)
+                self.headers = merge_invoice_headers(self.headers, headers)
+
+        self.part_paths = [get_part_path(self.output_csv_path, p) for p in range(self.partitions)]
+        self.part_rows = rows_written
+        self.data = None
+        if not append:
+            # full rebuild, outputs of a differently partitioned build are stale.
+            remove_files(
+                [self.output_csv_path, get_manifest_path(self.output_csv_path)]
+                + glob.glob(get_part_path(self.output_csv_path, '*')),
+                keep = self.part_paths
             )
 
-
-
-            # assigning the new id's to every row.
-            df = df.merge(df_time,     on = 'invoice_date', how = 'left')
-            df = df.merge(df_customer, on = 'client_id',    how = 'left')
-            df = df.merge(df_product,  on = 'product_id',   how = 'left')    
-            df = df.merge(df_payment_method,    on = 'payment_method_id', how = 'left')
-
-
-
-
-                        
-            today = str(datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S"))
-
-            df['ingestion_date'] = today
-            df['last_modified_date'] = today
-
-            # inserting ids for the dimension on the datawarehouse.
-            df = core.insert_ids(
-                dataframe = df,
-                starting_id = self.starting_id
+    def load_months(self) -> bool:
+        """
+        Month layout: every row goes to the part file of its month, sorted by
+        date and id, and the manifest keeps the bounds, rows and day offsets
+        of every partition. Incremental loads only touch the months of the
+        new rows (usually the last one).
+        """
+        df = core.apply_schema(self.data, self.output_schema)
+        manifest_path = get_manifest_path(self.output_csv_path)
+        append = bool(self.state is not None and self.last_state) and os.path.exists(manifest_path)
+        if append and len(df) == 0:
+            return True
+        manifest = load_manifest(manifest_path) if append else None
+        if manifest is None:
+            remove_files([self.output_csv_path, manifest_path] + glob.glob(get_part_path(self.output_csv_path, '*')))
+            manifest = {'layout' : self.layout, 'sort' : ['date', 'id'], 'partitions' : {}}
+
+        dates = get_fact_dates(df['time_id'])
+        order = numpy.lexsort((df['id'].to_numpy(), dates.to_numpy().view('int64')))
+        df, dates = df.take(order), dates.take(order)
+        months = dates.dt.strftime('%Y-%m').fillna(UNDATED_PARTITION).to_numpy()
+
+        for month, rows in pandas.Series(months).groupby(months, sort = True).indices.items():
+            manifest['partitions'][month] = save_fact_month(
+                dataframe      = df.iloc[rows],
+                dates          = dates.iloc[rows],
+                part_path      = get_part_path(self.output_csv_path, month),
+                entry          = manifest['partitions'].get(month),
+                storage_format = self.output_format
             )
+        save_manifest(manifest_path, manifest)
+
+        if self.sql_target is not None and not self.sql_target.write(
+                self.table_name, df, self.output_schema, self.sql_keys, self.sql_indexes, append
+            ):
+            return False
+        if len(df) > 0:
+            self.save_state(last_id = int(df['id'].max()))
+        return True
+
+    def get_table_paths(self) -> List[str]:
+        if self.layout is not None:
+            manifest = load_manifest(get_manifest_path(self.output_csv_path))
+            return sorted(entry['path'] for entry in (manifest or {'partitions' : {}})['partitions'].values())
+        if self.partitions:
+            return [get_part_path(self.output_csv_path, p) for p in range(self.partitions)]
+        return [self.output_csv_path]
+
+    def get_output_paths(self) -> List[str]:
+        manifest = [get_manifest_path(self.output_csv_path)] if self.layout is not None else []
+        return (
+            self.get_table_paths() + manifest + [INVOICE_HEADERS_PATH]
+            + [path for path, keys in ROLLUPS.values()]
+        )
+
+    def get_dependency_paths(self) -> List[str]:
+        return list(DIMENSION_PATHS.values())
+
+    def get_stale_paths(self) -> List[str]:
+        # outputs of a differently partitioned build.
+        paths = (
+            [self.output_csv_path, get_manifest_path(self.output_csv_path)]
+            + glob.glob(get_part_path(self.output_csv_path, '*'))
+        )
+        return [path for path in paths if os.path.exists(path) and path not in self.get_output_paths()]
+
+    def save_parts_sql(self) -> bool:
+        """ Writes the part files saved by the workers to the sql target, one part at a time. """
+        append = bool(self.state is not None and self.last_state)
+        for path in self.part_paths:
+            df = core.get_data(csv_path = path, schema = self.output_schema)
+            if append:
+                # only the rows of this run, parts keep the previous ones.
+                df = df[df['id'] >= self.starting_id]
+            if not self.sql_target.write(self.table_name, df, self.output_schema, self.sql_keys, self.sql_indexes, append):
+                return False
+            append = True
+        return True
+
+    def load(self) -> bool: 
+        if self.part_paths is not None:
+            # partitions were already saved by the workers.
+            result = all(os.path.exists(path) for path in self.part_paths)
+            if result and self.sql_target is not None:
+                result = self.save_parts_sql()
+            if result and self.part_rows > 0:
+                self.save_state(last_id = self.starting_id + self.part_rows - 1)
+        elif self.partitions:
+            # the partitioned transform failed, the data was never transformed.
+            result = False
+        elif self.layout is not None:
+            result = self.load_months()
+        else:
+            result = super().load()
+            if not self.is_appending():
+                remove_files(
+                    [get_manifest_path(self.output_csv_path)]
+                    + glob.glob(get_part_path(self.output_csv_path, '*'))
+                )
 
-            df = df[[
-                'id',
-                'invoice_id',
-                'time_dim_id',
-                'customer_dim_id',
-                'product_dim_id',
-                'payment_method_dim_id',
-                'product_quantity',
-                'total_per_product',
-                'total_invoice',
-                'currency_type',
-                'ingestion_date',
-                'last_modified_date'
-            ]]
-
-
-            df = df.rename(
-                columns = {
-                    'time_dim_id'       : 'time_id',
-                    'customer_dim_id'   : 'customer_id',
-                    'product_dim_id'    : 'product_id',
-                    'payment_method_dim_id' : 'payment_method_id',
-                }
+        if result and self.headers is not None:
+            result = load_invoice_headers(
+                headers = self.headers,
+                incremental = bool(self.state is not None and self.last_state),
+                sql_target = self.sql_target
+            )
+        if result and self.rollups is not None:
+            result = load_rollups(
+                rollups = self.rollups,
+                incremental = bool(self.state is not None and self.last_state)
             )
-
-            
-            self.data = df
-            print('Invoice.transform > True')
-        except Exception as e:
-            print('Invoice.transform > ERROR: ', str(e))
-
-    def load(self) -> None: 
-        result = super().load()
         print('Invoice.load > ', str(result))
-
-
-if __name__ == "__main__":
-
+        return result
+
+
+def get_tables(
+        state:Union[core.StateStore, None] = None,
+        partitions:Union[int, None] = None,
+        sql_target:Union[core.SqlTarget, None] = None,
+        sparse_time:bool = False,
+        time_padding:int = 0,
+        fact_layout:Union[str, None] = None
+    ) -> dict[str, core.ETL]:
+    """ Tables of the data warehouse stage, by name, dimensions first. """
     customers:Customer  = Customer(
         input_csv_path  = "docs/output_stagging/customers.csv",
-        output_csv_path = "docs/output_data_warehouse/customers_dim.csv",
-        starting_id     = 0 # last id from the database.
+        output_csv_path = DIMENSION_PATHS['customer'],
+        starting_id     = 0, # last id from the database.
+        state           = state
     )
-    customers.extract()
-    customers.transform()
-    customers.load()
-    
+
     products:Product  = Product(
         input_csv_path  = "docs/output_stagging/products.csv",
-        output_csv_path = "docs/output_data_warehouse/products_dim.csv",
-        starting_id     = 0 # last id from the database.
+        output_csv_path = DIMENSION_PATHS['product'],
+        starting_id     = 0, # last id from the database.
+        state           = state
     )
-    products.extract()
-    products.transform()
-    products.load()
 
-    # getting the time dimension data from the invoices date
+    # getting the time dimension data from the invoices date (validated ones)
     time:Time = Time(
-        input_csv_path  = "docs/output_stagging/invoices.csv",
-        output_csv_path = "docs/output_data_warehouse/time_dim.csv",
-        starting_id     = 0 # last id from the database.
+        input_csv_path  = "docs/output_validation/invoices_valid.csv",
+        output_csv_path = DIMENSION_PATHS['time'],
+        starting_id     = 0, # last id from the database.
+        grain           = 'day', # 'hour' or 'minute' for a finer time dimension.
+        state           = state,
+        index_path      = TIME_INDEX_PATH,
+        sparse          = sparse_time, # only the invoice dates, merged into the existing ones.
+        padding         = time_padding
     )
-    time.extract()
-    time.transform()
-    time.load()
 
     payment_method:PaymentMethod  = PaymentMethod(
         input_csv_path  = "... theres no data for this dimension, completely invented :D",
-        output_csv_path = "docs/output_data_warehouse/payment_method_dim.csv",
-        starting_id     = 0 # last id from the database.
+        output_csv_path = DIMENSION_PATHS['payment_method'],
+        starting_id     = 0, # last id from the database.
+        state           = state
     )
-    payment_method.extract()
-    payment_method.transform()
-    payment_method.load()
 
     invoices:Invoice  = Invoice(
-        input_csv_path  = "docs/output_stagging/invoices.csv",
+        input_csv_path  = "docs/output_validation/invoices_valid.csv",
         output_csv_path = "docs/output_data_warehouse/fact_invoices.csv",
-        starting_id     = 0 # last id from the database.
+        starting_id     = 0, # last id from the database.
+        time_grain      = 'day', # same grain as the time dimension.
+        state           = state,
+        partitions      = partitions, # built on a process pool, as part files.
+        layout          = fact_layout # 'month': partitioned by month, see read_fact_invoices.
     )
-    invoices.extract()
-    invoices.transform()
-    invoices.load()
\ No newline at end of file
+
+    tables = {
+        'customers_dim'      : customers,
+        'products_dim'       : products,
+        'time_dim'           : time,
+        'payment_method_dim' : payment_method,
+        'fact_invoices'      : invoices
+    }
+    # also loaded into a sql database (see core.SqlTarget) when given.
+    for table in tables.values():
+        table.sql_target = sql_target
+    return tables
+
+
+if __name__ == "__main__":
+
+    # incremental mode: python src/data_warehouse_tables.py --incremental
+    # only new staging rows are processed and appended, continuing the ids
+    # and high-water marks kept on the state file.
+    state = core.StateStore(STATE_PATH) if '--incremental' in sys.argv else None
+
+    # partitioned fact table: python src/data_warehouse_tables.py --partitions 8
+    partitions = (
+        int(sys.argv[sys.argv.index('--partitions') + 1])
+        if '--partitions' in sys.argv else None
+    )
+
+    # also loaded into a local sql database: python src/data_warehouse_tables.py --sql warehouse.duckdb
+    sql_target = (
+        core.SqlTarget(sys.argv[sys.argv.index('--sql') + 1], mode = 'upsert' if state else 'replace')
+        if '--sql' in sys.argv else None
+    )
+
+    # fact table partitioned by month: python src/data_warehouse_tables.py --fact-layout month
+    fact_layout = (
+        sys.argv[sys.argv.index('--fact-layout') + 1]
+        if '--fact-layout' in sys.argv else None
+    )
+
+    for table in get_tables(
+            state = state, partitions = partitions, sql_target = sql_target, fact_layout = fact_layout
+        ).values():
+        table.run()
@@ -0,0 +1,79 @@
+# pip install pandas
+import string
+import zlib
+import numpy
+import pandas
+from typing import Union
+
+# mock values depend only on the seed and the natural key of the row, so the
+# same customer always gets the same phone and email and outputs can be diffed.
+SEED:int = 0
+
+# splitmix64 constants.
+GOLDEN_GAMMA = numpy.uint64(0x9E3779B97F4A7C15)
+MIX_1 = numpy.uint64(0xBF58476D1CE4E5B9)
+MIX_2 = numpy.uint64(0x94D049BB133111EB)
+
+def mix(values:numpy.ndarray) -> numpy.ndarray:
+    """ splitmix64 finalizer, well distributed 64 bit values from any uint64 array. """
+    values = (values ^ (values >> numpy.uint64(30))) * MIX_1
+    values = (values ^ (values >> numpy.uint64(27))) * MIX_2
+    return values ^ (values >> numpy.uint64(31))
+
+def get_key_states(keys:Union[pandas.Series, None], salt:str, size:int, seed:int = SEED) -> numpy.ndarray:
+    """
+    One random state per row, from the hash of its natural key, the seed and a
+    salt (one per mocked column, so columns don't repeat each other). Without
+    keys every row gets its own state from a seeded numpy Generator.
+    """
+    salt_state = numpy.uint64((zlib.crc32(salt.encode('utf-8')) << 32) | (seed & 0xFFFFFFFF))
+    if keys is None:
+        rng = numpy.random.default_rng([seed, int(salt_state)])
+        return rng.integers(0, 2**64 - 1, size = size, dtype = numpy.uint64, endpoint = True)
+    hashes = pandas.util.hash_array(numpy.asarray(keys))
+    return mix(hashes ^ mix(numpy.full(len(hashes), salt_state, dtype = numpy.uint64)))
+
+def next_values(states:numpy.ndarray) -> numpy.ndarray:
+    """ Advances the row states in place (splitmix64), returns their next random values. """
+    states += GOLDEN_GAMMA
+    return mix(states)
+
+def get_random_strings(alphabet:str, length:int, states:numpy.ndarray) -> numpy.ndarray:
+    """
+    Random strings without repeated characters (as random.sample does), one per
+    row state: a partial Fisher-Yates shuffle of the alphabet, one column at a time.
+    """
+    codes = numpy.frombuffer(alphabet.encode('ascii'), dtype = numpy.uint8)
+    pool = numpy.tile(codes, (len(states), 1))
+    rows = numpy.arange(len(states))
+    states = states.copy()
+
+    for position in range(length):
+        picks = position + (next_values(states) % numpy.uint64(len(codes) - position)).astype(numpy.intp)
+        chosen = pool[rows, picks]
+        pool[rows, picks] = pool[:, position]
+        pool[:, position] = chosen
+
+    return numpy.ascontiguousarray(pool[:, :length]).view(f'S{length}').ravel().astype(str)
+
+def get_phone_numbers(keys:Union[pandas.Series, None] = None, size:int = 0, seed:int = SEED) -> numpy.ndarray:
+    """ Mock phone numbers similar to the mexican format, one per key (or size rows). """
+    size = size if keys is None else len(keys)
+    states = get_key_states(keys, 'phone_number', size, seed)
+    return numpy.char.add('+52', get_random_strings(string.digits, 10, states))
+
+def get_emails(keys:Union[pandas.Series, None] = None, size:int = 0, seed:int = SEED) -> numpy.ndarray:
+    """ Mock email adresses, one per key (or size rows). """
+    size = size if keys is None else len(keys)
+    users = get_random_strings(string.ascii_letters, 10, get_key_states(keys, 'email_user', size, seed))
+    domains = get_random_strings(string.ascii_lowercase, 6, get_key_states(keys, 'email_domain', size, seed))
+    return numpy.char.add(numpy.char.add(users, '@'), numpy.char.add(domains, '.com'))
+
+def get_choices(
+        values:list, keys:Union[pandas.Series, None] = None, size:int = 0,
+        salt:str = 'choice', seed:int = SEED
+    ) -> numpy.ndarray:
+    """ Picks one of the values for every key (or size rows), e.g. the payment method of an invoice. """
+    size = size if keys is None else len(keys)
+    states = get_key_states(keys, salt, size, seed)
+    return numpy.asarray(values)[(mix(states) % numpy.uint64(len(values))).astype(numpy.intp)]
@@ -0,0 +1,243 @@
+# pip install pandas
+import argparse
+import sys
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import List, Union
+import core
+import stagging_tables
+import validation_tables
+import data_warehouse_tables
+
+STAGES:List[str] = ['stagging', 'validation', 'warehouse']
+
+# every table (stage.table) and the tables it needs to be finished first.
+DEPENDENCIES:dict[str, List[str]] = {
+    'stagging.customers'           : [],
+    'stagging.products'            : [],
+    'stagging.invoices'            : [],
+    'validation.invoices'          : ['stagging.invoices', 'stagging.customers', 'stagging.products'],
+    'warehouse.customers_dim'      : ['stagging.customers'],
+    'warehouse.products_dim'       : ['stagging.products'],
+    'warehouse.time_dim'           : ['validation.invoices'],
+    'warehouse.payment_method_dim' : [],
+    'warehouse.fact_invoices'      : [
+        'validation.invoices',
+        'warehouse.customers_dim',
+        'warehouse.products_dim',
+        'warehouse.time_dim',
+        'warehouse.payment_method_dim'
+    ]
+}
+
+def get_tables(
+        chunk_size:Union[int, None] = None,
+        invoices_path:Union[str, List[str]] = stagging_tables.INVOICES_PATH,
+        state:Union[core.StateStore, None] = None,
+        partitions:Union[int, None] = None,
+        sql_target:Union[core.SqlTarget, None] = None,
+        sparse_time:bool = False,
+        time_padding:int = 0,
+        fact_layout:Union[str, None] = None
+    ) -> dict[str, core.ETL]:
+    """ Tables of every stage, by their stage.table name. """
+    tables = {}
+    for name, table in stagging_tables.get_tables(chunk_size = chunk_size, invoices_path = invoices_path).items():
+        tables['stagging.' + name] = table
+    for name, table in validation_tables.get_tables().items():
+        tables['validation.' + name] = table
+    for name, table in data_warehouse_tables.get_tables(
+            state = state, partitions = partitions, sql_target = sql_target,
+            sparse_time = sparse_time, time_padding = time_padding, fact_layout = fact_layout
+        ).items():
+        tables['warehouse.' + name] = table
+    return tables
+
+def run_table(table:core.ETL) -> bool:
+    """ Runs one table, module level so it can be sent to a process pool. """
+    return table.run()
+
+class Pipeline:
+    """
+    Runs the ETL tables as a DAG: every table starts as soon as the tables it
+    depends on are finished, independent ones running at the same time.
+    """
+
+    tables: dict = None
+    dependencies: dict = None
+    max_workers: Union[int, None] = None
+    use_processes: bool = False
+
+    def __init__(
+            self,
+            tables:dict[str, core.ETL],
+            dependencies:dict[str, List[str]] = DEPENDENCIES,
+            max_workers:Union[int, None] = None,
+            use_processes:bool = False
+        ) -> None:
+        self.tables = tables
+        self.dependencies = dependencies
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+
+    def select(self, stage:Union[str, None] = None, table:Union[str, None] = None) -> List[str]:
+        """ Names of the tables to run: everything, one stage or one table. """
+        if table is not None:
+            names = [name for name in self.tables if table in (name, name.split('.', 1)[1])]
+            if not names:
+                raise ValueError(f'unknown table: {table}')
+            return names
+        if stage is not None:
+            return [name for name in self.tables if name.startswith(stage + '.')]
+        return list(self.tables)
+
+    def run(self, names:Union[List[str], None] = None) -> dict[str, bool]:
+        """
+        Runs the selected tables (all by default). Dependencies outside the
+        selection are taken as already built; a failed table skips the ones
+        depending on it.
+        """
+        names = list(self.tables) if names is None else names
+        needs = {
+            name : {dependency for dependency in self.dependencies.get(name, []) if dependency in names}
+            for name in names
+        }
+        pending = {name : set(dependencies) for name, dependencies in needs.items()}
+        results:dict[str, bool] = {}
+        running:dict[Future, str] = {}
+
+        # fused runs keep an output in memory only until its last reader is done.
+        frames = core.FRAMES
+        if frames is not None:
+            for dependencies in needs.values():
+                for dependency in dependencies:
+                    frames.expect(self.tables[dependency].output_csv_path)
+
+        def finish(name:str, result:bool) -> None:
+            results[name] = result
+            if frames is not None:
+                for dependency in needs[name]:
+                    frames.release(self.tables[dependency].output_csv_path)
+
+        pool_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        executor:Executor
+        with pool_class(max_workers = self.max_workers) as executor:
+            while pending or running:
+                progressed = False
+                for name, dependencies in list(pending.items()):
+                    if any(results.get(dependency) is False for dependency in dependencies):
+                        print(f'Pipeline.run > {name} skipped, a dependency failed.')
+                        finish(name, False)
+                        del pending[name]
+                        progressed = True
+                    elif all(dependency in results for dependency in dependencies):
+                        running[executor.submit(run_table, self.tables[name])] = name
+                        del pending[name]
+
+                if not running:
+                    if pending and not progressed:
+                        raise ValueError(f'dependency cycle between: {list(pending)}')
+                    continue
+
+                done, _ = wait(running, return_when = FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        print(f'Pipeline.run > {name} ERROR: ', str(e))
+                        result = False
+                    finish(name, result)
+
+        return results
+
+
+if __name__ == "__main__":
+
+    # python src/pipeline.py                              -> every stage
+    # python src/pipeline.py --stage warehouse            -> one stage
+    # python src/pipeline.py --table fact_invoices        -> one table
+    parser = argparse.ArgumentParser(description = 'Runs the ETL pipeline.')
+    parser.add_argument('--stage', choices = STAGES, help = 'run only one stage.')
+    parser.add_argument('--table', help = 'run only one table, e.g: time_dim or warehouse.time_dim.')
+    parser.add_argument('--workers', type = int, default = None, help = 'max tables running at the same time.')
+    parser.add_argument('--processes', action = 'store_true', help = 'use a process pool instead of threads.')
+    parser.add_argument('--chunk-size', type = int, default = None, help = 'stream the staging invoices in chunks.')
+    parser.add_argument('--invoices', default = stagging_tables.INVOICES_PATH, help = 'invoice files, e.g: "docs/input_files/invoices_*.csv".')
+    parser.add_argument('--incremental', action = 'store_true', help = 'incremental warehouse loads.')
+    parser.add_argument('--partitions', type = int, default = None, help = 'build the fact table in partitions.')
+    parser.add_argument('--fact-layout', choices = data_warehouse_tables.FACT_LAYOUTS, default = None, help = 'fact table partitioned by month, sorted by date.')
+    parser.add_argument('--sparse-time', action = 'store_true', help = 'time dimension with only the invoice dates.')
+    parser.add_argument('--time-padding', type = int, default = 0, help = 'sparse time dimension: grains added around every date.')
+    parser.add_argument('--fused', action = 'store_true', help = 'hand the outputs to the next tables in memory (threads only).')
+    parser.add_argument('--no-intermediate-files', action = 'store_true', help = 'fused runs: skip writing the staging and validation outputs.')
+    parser.add_argument('--sql', default = None, help = 'also load the warehouse into a sql database file, e.g: warehouse.duckdb.')
+    parser.add_argument('--sql-engine', choices = ['duckdb', 'sqlite'], default = None, help = 'duckdb when installed by default.')
+    parser.add_argument('--sql-mode', choices = core.SQL_MODES, default = None, help = 'replace (upsert on incremental loads by default).')
+    parser.add_argument('--metrics', default = None, help = 'json lines file for the per step metrics.')
+    parser.add_argument('--trace-memory', action = 'store_true', help = 'measure python allocations (slower).')
+    parser.add_argument('--cache-dir', default = '.etl_cache', help = 'build cache folder, unchanged tables are restored from it.')
+    parser.add_argument('--cache-size', type = int, default = 1024, help = 'max build cache size (MB).')
+    parser.add_argument('--no-cache', action = 'store_true', help = 'run every table, without the build cache.')
+    parser.add_argument('--invalidate-cache', action = 'store_true', help = 'drop the cached builds of the selected tables and exit.')
+    args = parser.parse_args()
+    if args.fused and args.processes:
+        parser.error('--fused shares the outputs in memory, it needs threads (no --processes).')
+    if args.no_intermediate_files and not args.fused:
+        parser.error('--no-intermediate-files needs --fused.')
+    if args.fact_layout and args.partitions:
+        parser.error('--fact-layout and --partitions are different fact table layouts.')
+
+    metrics = (
+        core.enable_metrics(jsonl_path = args.metrics, trace_memory = args.trace_memory)
+        if args.metrics or args.trace_memory else None
+    )
+    cache = (
+        core.enable_build_cache(directory = args.cache_dir, max_bytes = args.cache_size * 1024**2)
+        if not args.no_cache or args.invalidate_cache else None
+    )
+    state = core.StateStore(data_warehouse_tables.STATE_PATH) if args.incremental else None
+    sql_target = core.SqlTarget(
+        path   = args.sql,
+        engine = args.sql_engine,
+        mode   = args.sql_mode or ('upsert' if args.incremental else 'replace')
+    ) if args.sql else None
+    pipeline = Pipeline(
+        tables        = get_tables(
+            chunk_size    = args.chunk_size,
+            invoices_path = args.invoices,
+            state         = state,
+            partitions    = args.partitions,
+            sql_target    = sql_target,
+            sparse_time   = args.sparse_time,
+            time_padding  = args.time_padding,
+            fact_layout   = args.fact_layout
+        ),
+        max_workers   = args.workers,
+        use_processes = args.processes
+    )
+    names = pipeline.select(stage = args.stage, table = args.table)
+
+    if args.fused:
+        # python src/pipeline.py --fused --no-intermediate-files
+        core.enable_frame_store()
+        for name, table in pipeline.tables.items():
+            if args.no_intermediate_files and not name.startswith('warehouse.'):
+                table.write_output = False
+
+    if args.invalidate_cache:
+        # python src/pipeline.py --invalidate-cache [--stage ... | --table ...]
+        removed = sum(cache.invalidate(pipeline.tables[name].output_csv_path) for name in names)
+        print(f'Pipeline > {removed} cached builds removed.')
+        sys.exit(0)
+
+    results = pipeline.run(names)
+
+    for name, result in results.items():
+        print(f'{name} > {result}')
+
+    if metrics is not None:
+        if args.processes:
+            # the records were written by the worker processes.
+            metrics.reload()
+        print(metrics.summary().to_string())
+    sys.exit(0 if all(results.values()) else 1)
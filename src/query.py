@@ -0,0 +1,251 @@
+# pip install pandas duckdb   (duckdb is optional, sqlite3 is used without it)
+import argparse
+import glob
+import os
+import sqlite3
+import threading
+from typing import Any, List, Union
+import pandas
+import core
+import data_warehouse_tables
+
+# warehouse outputs registered as tables, glob patterns match part files too.
+WAREHOUSE_TABLES:dict[str, Union[str, List[str]]] = {
+    'fact_invoices'      : [
+        "docs/output_data_warehouse/fact_invoices.csv",
+        "docs/output_data_warehouse/fact_invoices.part-*.csv"
+    ],
+    'fact_invoice_headers' : data_warehouse_tables.INVOICE_HEADERS_PATH,
+    'time_dim'           : data_warehouse_tables.DIMENSION_PATHS['time'],
+    'customers_dim'      : data_warehouse_tables.DIMENSION_PATHS['customer'],
+    'products_dim'       : data_warehouse_tables.DIMENSION_PATHS['product'],
+    'payment_method_dim' : data_warehouse_tables.DIMENSION_PATHS['payment_method']
+}
+
+# README questions, parameterized (same sql on duckdb and sqlite).
+BEST_SELLING_PRODUCT_PER_QUARTER = """
+    WITH
+    all_data AS
+    (
+        SELECT
+            q.quarter,
+            p.name as product_name,
+            COUNT(invoice_id) AS num_products_per_invoice
+        FROM fact_invoices i
+        INNER JOIN time_dim q     ON q.id = i.time_id
+        INNER JOIN products_dim p ON p.id = i.product_id
+        WHERE (? IS NULL OR q.year = ?)
+        GROUP BY
+            q.quarter,
+            product_name
+    ),
+    max_per_quarter AS
+    (
+        SELECT
+            quarter,
+            MAX(num_products_per_invoice) AS max_quantity
+        FROM all_data
+        GROUP BY quarter
+    )
+
+    SELECT
+        A.quarter,
+        U.product_name,
+        A.max_quantity
+    FROM max_per_quarter A
+    LEFT JOIN all_data AS U
+    ON
+        A.quarter = U.quarter
+        AND max_quantity = U.num_products_per_invoice
+    ORDER BY A.quarter, U.product_name
+"""
+
+LOYAL_CUSTOMER_TRENDS = """
+    WITH
+    top_customers AS
+    (
+        SELECT customer_id, customer, invoices FROM (
+            SELECT
+            c.customer_id,
+            cur.name AS customer,
+            COUNT(i.invoice_id) as invoices
+            FROM fact_invoices i
+            INNER JOIN time_dim q ON q.id = i.time_id
+            -- every version of a customer counts for it, named as its current one.
+            INNER JOIN customers_dim c ON c.id = i.customer_id
+            INNER JOIN customers_dim cur ON cur.customer_id = c.customer_id AND cur.is_current
+            GROUP BY c.customer_id, cur.name
+        ) AS customers_invoices
+        ORDER BY invoices DESC, customer_id LIMIT ?
+    ),
+    categories_per_customer AS
+    (
+        SELECT
+            t.customer,
+            p.category,
+            COUNT(p.category) AS items_per_category
+        FROM fact_invoices i
+        INNER JOIN customers_dim c ON c.id = i.customer_id
+        INNER JOIN top_customers t ON c.customer_id = t.customer_id
+        INNER JOIN products_dim p ON p.id = i.product_id
+        GROUP BY t.customer, p.category
+    )
+
+    SELECT
+    A.customer,
+    A.category
+    FROM categories_per_customer A
+    INNER JOIN -- TOP product categories per customer
+    (
+        SELECT customer, MAX(items_per_category) as max_items
+        FROM categories_per_customer
+        GROUP BY customer
+    ) B ON
+        A.customer = B.customer
+        AND A.items_per_category = B.max_items
+    ORDER BY A.customer, A.category
+"""
+
+SALES_PER_MONTH = """
+    WITH
+    all_data AS
+    (
+        SELECT
+            t.year,
+            t.month,
+            t.month_string,
+            COUNT(h.invoice_id) AS invoice_quantity,
+            ROUND(SUM(h.total_invoice), 3) AS total_ammount
+        FROM fact_invoice_headers h
+        INNER JOIN time_dim t ON h.time_id = t.id
+        WHERE (? IS NULL OR t.year = ?)
+        GROUP BY
+            t.year,
+            t.month,
+            t.month_string
+    )
+    SELECT year, month_string, invoice_quantity, total_ammount
+    FROM all_data
+    ORDER BY year, month
+"""
+
+def get_table_files(patterns:Union[str, List[str]]) -> List[str]:
+    patterns = [patterns] if isinstance(patterns, str) else patterns
+    return sorted(path for pattern in patterns for path in glob.glob(pattern))
+
+def get_signature(pattern:Union[str, List[str]]) -> tuple:
+    """ Changes whenever one of the table files changes (or files are added / removed). """
+    signature = []
+    for path in get_table_files(pattern):
+        stat = os.stat(path)
+        signature.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+class WarehouseQueries:
+    """
+    Local query layer over the warehouse outputs. Tables are loaded once into
+    an embedded engine (duckdb when installed, sqlite otherwise) and reloaded
+    only when their files change; query results are cached until then.
+    """
+
+    tables: dict = None
+    engine: Union[str, None] = None
+
+    def __init__(
+            self,
+            tables:dict[str, Union[str, List[str]]] = WAREHOUSE_TABLES,
+            engine:Union[str, None] = None
+        ) -> None:
+        self.tables = tables
+        self.engine = engine or core.get_default_sql_engine()
+        self.signatures:dict[str, tuple] = {}
+        self.results:dict[tuple, pandas.DataFrame] = {}
+        self.lock = threading.Lock()
+
+        if self.engine == 'duckdb':
+            import duckdb
+            self.connection = duckdb.connect(database = ':memory:')
+        else:
+            self.connection = sqlite3.connect(':memory:', check_same_thread = False)
+
+    def register(self, name:str, pattern:Union[str, List[str]]) -> None:
+        """ (Re)loads one table from its files into the engine. """
+        paths = get_table_files(pattern)
+        if not paths:
+            raise FileNotFoundError(f'no files for table {name}: {pattern}')
+        schema = data_warehouse_tables.SCHEMAS.get(name)
+
+        if self.engine == 'duckdb':
+            readers = {'csv' : 'read_csv_auto', 'parquet' : 'read_parquet'}
+            storage_format = core.get_storage_format(paths[0])
+            if storage_format in readers:
+                self.connection.execute(
+                    f'CREATE OR REPLACE TABLE {name} AS SELECT * FROM {readers[storage_format]}(?)',
+                    [paths]
+                )
+                return
+            df = pandas.concat([core.get_data(csv_path = path, schema = schema) for path in paths], ignore_index = True)
+            self.connection.register('new_table', df)
+            self.connection.execute(f'CREATE OR REPLACE TABLE {name} AS SELECT * FROM new_table')
+            self.connection.unregister('new_table')
+        else:
+            df = pandas.concat([core.get_data(csv_path = path, schema = schema) for path in paths], ignore_index = True)
+            # sqlite integers are signed 64 bit, row hashes keep their bits as int64.
+            for column in df.columns[df.dtypes == 'uint64']:
+                df[column] = df[column].to_numpy().view('int64')
+            df.to_sql(name, self.connection, if_exists = 'replace', index = False)
+
+    def refresh(self) -> tuple:
+        """ Reloads the tables whose files changed, returns the current signatures. """
+        for name, pattern in self.tables.items():
+            signature = get_signature(pattern)
+            if self.signatures.get(name) != signature:
+                self.register(name, pattern)
+                self.signatures[name] = signature
+        return tuple(self.signatures[name] for name in self.tables)
+
+    def query(self, sql:str, params:List[Any] = []) -> pandas.DataFrame:
+        """ Result of a query, cached until any of the table files changes. """
+        with self.lock:
+            signatures = self.refresh()
+            key = (sql, tuple(params), signatures)
+            if key not in self.results:
+                # previous results belong to old files.
+                self.results = {k : v for k, v in self.results.items() if k[2] == signatures}
+                if self.engine == 'duckdb':
+                    self.results[key] = self.connection.execute(sql, params).df()
+                else:
+                    self.results[key] = pandas.read_sql_query(sql, self.connection, params = params)
+            return self.results[key].copy()
+
+    def best_selling_product_per_quarter(self, year:Union[int, None] = None) -> pandas.DataFrame:
+        """ ¿Cuál es el producto más vendido en cada trimestre del año? """
+        return self.query(BEST_SELLING_PRODUCT_PER_QUARTER, [year, year])
+
+    def loyal_customer_trends(self, top:int = 10) -> pandas.DataFrame:
+        """ ¿Cuáles son las tendencias de compra de los clientes más leales? """
+        return self.query(LOYAL_CUSTOMER_TRENDS, [top])
+
+    def sales_per_month(self, year:Union[int, None] = None) -> pandas.DataFrame:
+        """ ¿Cómo varían las ventas durante el año? """
+        return self.query(SALES_PER_MONTH, [year, year])
+
+
+if __name__ == "__main__":
+
+    # python src/query.py best_selling_product_per_quarter --year 2023
+    parser = argparse.ArgumentParser(description = 'README questions over the local warehouse outputs.')
+    parser.add_argument('question', choices = [
+        'best_selling_product_per_quarter', 'loyal_customer_trends', 'sales_per_month'
+    ])
+    parser.add_argument('--year', type = int, default = None)
+    parser.add_argument('--top', type = int, default = 10)
+    parser.add_argument('--engine', choices = ['duckdb', 'sqlite'], default = None)
+    args = parser.parse_args()
+
+    queries = WarehouseQueries(engine = args.engine)
+    if args.question == 'loyal_customer_trends':
+        result = queries.loyal_customer_trends(top = args.top)
+    else:
+        result = getattr(queries, args.question)(year = args.year)
+    print(result.to_string(index = False))
@@ -1,151 +1,215 @@
 # pip install pandas
+import sys
+import pandas
+from typing import List, Union
 import core
+import mock_data
+
+# declared dtypes of the input files and the staging outputs: compact integers,
+# categoricals for repeated strings and real dates, so nothing is inferred.
+SCHEMAS:dict[str, dict[str,str]] = {
+    'input_customers' : {
+        'ID'        : 'int32',
+        'Ubicacion' : 'category',
+        'Segmento'  : 'category'
+    },
+    'input_products'  : {
+        'ID'        : 'int32',
+        'Categoria' : 'category',
+        'Precio'    : 'float64'
+    },
+    'input_invoices'  : {
+        # Fecha is parsed on transform, invalid dates are kept (as NaT) for validation.
+        'ID'         : 'int32',
+        'ClienteID'  : 'Int32',
+        'ProductoID' : 'Int32',
+        'Cantidad'   : 'float32', # may come empty.
+        'Total'      : 'float64'
+    },
+    'customers'       : {
+        'customer_id'   : 'int32',
+        'location_name' : 'category',
+        'segment_name'  : 'category',
+        'phone_number'  : 'object' # read back as text, keeping the leading '+'.
+    },
+    'products'        : {
+        'product_id'    : 'int32',
+        'price'         : 'float64',
+        'category'      : 'category',
+        'currency_type' : 'category'
+    },
+    'invoices'        : {
+        'invoice_id'       : 'int32',
+        'invoice_date'     : 'datetime64[ns]',
+        # missing values are kept as <NA>, see validation_tables.
+        'product_quantity' : 'Int32',
+        'total_invoice'    : 'float64',
+        'currency_type'    : 'category',
+        'client_id'        : 'Int32',
+        'product_id'       : 'Int32',
+        'source_file'      : 'category' # only on inputs of many files.
+    }
+}
+
+# invoices input, a file or a glob pattern (e.g. one file per day or branch office).
+INVOICES_PATH:str = "docs/input_files/invoices.csv"
 
 class Customer(core.ETL):
+    input_schema = SCHEMAS['input_customers']
+    output_schema = SCHEMAS['customers']
+    output_columns = {
+        'customer_id'   : 'ID',
+        # cleaning invalid vocals
+        'name'          : lambda df : core.translate_column(df['Nombre'], core.INVALID_VOCALS),
+        'location_name' : lambda df : core.translate_column(df['Ubicacion'], core.INVALID_VOCALS),
+        'segment_name'  : 'Segmento',
+        # simulating a phone number and email input
+        # (seeded, the same customer always gets the same ones).
+        'phone_number'  : lambda df : mock_data.get_phone_numbers(keys = df['ID']),
+        'email'         : lambda df : mock_data.get_emails(keys = df['ID'])
+    }
+
     def __init__(self, input_csv_path, output_csv_path) -> bool:
         super().__init__(input_csv_path, output_csv_path)
 
-    def extract(self) -> None: 
+    def extract(self) -> bool: 
         result = super().extract()
         print('Customer.extract > ', str(result))
+        return result
 
-    def transform(self) -> None:
+    def transform(self) -> bool:
         try:
-            df = self.data.copy()
-            
-            df['customer_id'] = df['ID']
-            df['segment_name'] = df['Segmento']
-            
-            # cleaning invalid vocals
-            df['name'] = df['Nombre'].map(lambda x : x.translate(core.INVALID_VOCALS))
-            df['location_name'] = df['Ubicacion'].map(lambda x : x.translate(core.INVALID_VOCALS))
-            
-            # simulating a phone number and email input
-            df['phone_number'] = df['ID'].map(lambda x : core.get_mock_phone_number())
-            df['email'] = df['ID'].map(lambda x : core.get_mock_email())
-            
-            # selecting only clean fields
-            df = df[[
-                'customer_id', 'name', 'location_name',
-                'segment_name', 'phone_number', 'email'
-            ]]
-            
-            self.data = df
-            print('Customer.transform > True')
+            result = super().transform()
+            print('Customer.transform > ', str(result))
+            return result
         except Exception as e:
             print('Customer.transform > ERROR: ', str(e))
+            return False
 
-    def load(self) -> None: 
+    def load(self) -> bool: 
         result = super().load()
         print('Customer.load > ', str(result))
+        return result
 
 
 class Product(core.ETL):
+    input_schema = SCHEMAS['input_products']
+    output_schema = SCHEMAS['products']
+    output_columns = {
+        'product_id'    : 'ID',
+        'name'          : 'Nombre',
+        'price'         : 'Precio',
+        # cleaning invalid vocals
+        'category'      : lambda df : core.translate_column(df['Categoria'], core.INVALID_VOCALS),
+        # simulating currency type
+        'currency_type' : lambda df : core.get_constant_column("MXN", len(df))
+    }
+
     def __init__(self, input_csv_path, output_csv_path) -> bool:
         super().__init__(input_csv_path, output_csv_path)
 
-    def extract(self) -> None: 
+    def extract(self) -> bool: 
         result = super().extract()
         print('Product.extract > ', str(result))
+        return result
 
-    def transform(self) -> None:
+    def transform(self) -> bool:
         try:
-            df = self.data.copy()
-            
-            df['product_id'] = df['ID']
-            df['name'] = df['Nombre']
-            df['price'] = df['Precio']
-
-            # cleaning invalid vocals
-            df['category'] = df['Categoria'].map(
-                lambda x : x.translate(core.INVALID_VOCALS)
-            )
-            
-            # simulating currency type
-            df['currency_type'] = df['ID'].map(lambda x : "MXN")
-            
-            # selecting only clean fields
-            df = df[[
-                'product_id', 'name',
-                'price', 'category',
-                'currency_type'
-            ]]
-            
-            self.data = df
-            print('Product.transform > True')
+            result = super().transform()
+            print('Product.transform > ', str(result))
+            return result
         except Exception as e:
             print('Product.transform > ERROR: ', str(e))
+            return False
 
-    def load(self) -> None: 
+    def load(self) -> bool: 
         result = super().load()
         print('Product.load > ', str(result))
+        return result
 
 
 class Invoice(core.ETL):
+    input_schema = SCHEMAS['input_invoices']
+    output_schema = SCHEMAS['invoices']
+    output_columns = {
+        'invoice_id'       : 'ID',
+        'invoice_date'     : lambda df : pandas.to_datetime(df['Fecha'], errors = 'coerce', format = 'ISO8601'),
+        # empty quantities are left to the validation stage.
+        'product_quantity' : lambda df : df['Cantidad'].round().astype('Int32'),
+        'total_invoice'    : 'Total',
+        # simulating currency type
+        'currency_type'    : lambda df : core.get_constant_column("MXN", len(df)),
+        'client_id'        : 'ClienteID',
+        'product_id'       : 'ProductoID'
+    }
+
     def __init__(self, input_csv_path, output_csv_path) -> bool:
         super().__init__(input_csv_path, output_csv_path)
 
-    def extract(self) -> None: 
+    def extract(self) -> bool: 
         result = super().extract()
         print('Invoice.extract > ', str(result))
+        return result
 
-    def transform(self) -> None:
+    def get_output_columns(self) -> dict:
+        # file of every row, when the invoices come in many files.
+        if self.source_column in self.data.columns:
+            return {**self.output_columns, self.source_column : self.source_column}
+        return self.output_columns
+
+    def transform(self) -> bool:
         try:
-            df = self.data.copy()
-        
-            df['invoice_id'] = df['ID']
-            df['invoice_date'] = df['Fecha']
-            df['client_id'] = df['ClienteID']
-            df['product_id'] = df['ProductoID']
-            df['total_invoice'] = df['Total']
-
-            # applying tranformations
-            df['product_quantity'] = df['Cantidad'].fillna(0)
-
-            # simulating currency type
-            df['currency_type'] = df['ID'].map(lambda x : "MXN")
-
-            # selecting only clean fields
-            df = df[[
-                'invoice_id', 'invoice_date',
-                'product_quantity',
-                'total_invoice',
-                'currency_type',
-                'client_id', 'product_id'
-            ]]
-            
-            self.data = df
-            print('Invoice.transform > True')
+            result = super().transform()
+            print('Invoice.transform > ', str(result))
+            return result
         except Exception as e:
             print('Invoice.transform > ERROR: ', str(e))
+            return False
 
-    def load(self) -> None: 
+    def load(self) -> bool: 
         result = super().load()
         print('Invoice.load > ', str(result))
+        return result
 
 
-if __name__ == "__main__":
-
+def get_tables(
+        chunk_size:Union[int, None] = None,
+        invoices_path:Union[str, List[str]] = INVOICES_PATH
+    ) -> dict[str, core.ETL]:
+    """
+    Tables of the staging stage, by name. The invoices can come in many files
+    (a glob pattern or a list, e.g. one per day), read at the same time.
+    """
     customers:Customer  = Customer(
         input_csv_path  = "docs/input_files/customers.csv",
         output_csv_path = "docs/output_stagging/customers.csv"
     )
-    customers.extract()
-    customers.transform()
-    customers.load()
 
     products:Product  = Product(
         input_csv_path  = "docs/input_files/products.csv",
         output_csv_path = "docs/output_stagging/products.csv"
     )
-    products.extract()
-    products.transform()
-    products.load()
 
     invoices:Invoice  = Invoice(
-        input_csv_path  = "docs/input_files/invoices.csv",
+        input_csv_path  = invoices_path,
         output_csv_path = "docs/output_stagging/invoices.csv"
     )
-    invoices.extract()
-    invoices.transform()
-    invoices.load()
\ No newline at end of file
+    # streaming the invoices, the biggest input, when a chunk size is given.
+    invoices.chunk_size = chunk_size
+
+    return {
+        'customers' : customers,
+        'products'  : products,
+        'invoices'  : invoices
+    }
+
+
+if __name__ == "__main__":
+
+    # optional chunk size (rows) for streaming the invoices, the biggest input,
+    # and invoice files: python src/stagging_tables.py 100000 "docs/input_files/invoices_*.csv"
+    chunk_size = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1] != '0' else None
+    invoices_path = sys.argv[2] if len(sys.argv) > 2 else INVOICES_PATH
+
+    for table in get_tables(chunk_size = chunk_size, invoices_path = invoices_path).values():
+        table.run()
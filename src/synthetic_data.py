@@ -0,0 +1,128 @@
+# pip install pandas
+import argparse
+import os
+import string
+import numpy
+import pandas
+from typing import Iterator
+
+# values seen on the sample input files (docs/input_files).
+FIRST_NAMES = ['Alejandro', 'Carlos', 'Fernando', 'Jorge', 'José', 'Juan', 'Luis', 'Manuel', 'Miguel', 'Pedro']
+LAST_NAMES = ['Cruz', 'García', 'González', 'Hernández', 'López', 'Martínez', 'Pérez', 'Ramírez', 'Rodríguez', 'Sánchez']
+LOCATIONS = [
+    'Puebla', 'Mérida', 'Querétaro', 'Cancún', 'Morelia', 'León',
+    'Tijuana', 'Ciudad de México', 'Guadalajara', 'Monterrey'
+]
+SEGMENTS = ['Pequeño', 'Mediano', 'Grande']
+CATEGORIES = ['Juguete', 'Hogar', 'Electrónica', 'Ropa']
+
+def get_customers(size:int, rng:numpy.random.Generator) -> pandas.DataFrame:
+    """ customers.csv rows: ID,Nombre,Ubicacion,Segmento """
+    first_names = numpy.array(FIRST_NAMES, dtype = object)[rng.integers(0, len(FIRST_NAMES), size)]
+    last_names = numpy.array(LAST_NAMES, dtype = object)[rng.integers(0, len(LAST_NAMES), size)]
+    return pandas.DataFrame({
+        'ID'        : numpy.arange(1, size + 1),
+        'Nombre'    : first_names + ' ' + last_names,
+        'Ubicacion' : numpy.array(LOCATIONS, dtype = object)[rng.integers(0, len(LOCATIONS), size)],
+        'Segmento'  : numpy.array(SEGMENTS, dtype = object)[rng.integers(0, len(SEGMENTS), size)]
+    })
+
+def get_products(size:int, rng:numpy.random.Generator) -> pandas.DataFrame:
+    """ products.csv rows: ID,Nombre,Categoria,Precio """
+    letters = numpy.frombuffer(string.ascii_uppercase.encode('ascii'), dtype = numpy.uint8)
+    names = letters[rng.integers(0, len(letters), (size, 10))].view('S10').ravel().astype(str)
+    return pandas.DataFrame({
+        'ID'        : numpy.arange(1, size + 1),
+        'Nombre'    : numpy.char.add('Prod_', names),
+        'Categoria' : numpy.array(CATEGORIES, dtype = object)[rng.integers(0, len(CATEGORIES), size)],
+        'Precio'    : rng.uniform(10, 500, size)
+    })
+
+def iter_invoices(
+        size:int, customers:int, products:int, rng:numpy.random.Generator,
+        start_date:str = '2023-01-01', days:int = 365,
+        max_lines:int = 1, chunk_rows:int = 1_000_000
+    ) -> Iterator[pandas.DataFrame]:
+    """
+    invoices.csv rows: ID,Fecha,ClienteID,ProductoID,Cantidad,Total, in chunks.
+    With max_lines > 1 an invoice spreads over 1..max_lines product lines that
+    share its ID, date and customer.
+    """
+    start = numpy.datetime64(start_date, 'D')
+    next_id = 1
+    written = 0
+    while written < size:
+        rows = min(chunk_rows, size - written)
+
+        lines = rng.integers(1, max_lines + 1, rows)
+        ids = numpy.repeat(numpy.arange(next_id, next_id + rows), lines)[:rows]
+        # invoice attributes, repeated on every line of the invoice.
+        first = numpy.concatenate([[True], ids[1:] != ids[:-1]])
+        invoice_index = numpy.cumsum(first) - 1
+        invoices = invoice_index[-1] + 1
+        dates = (start + rng.integers(0, days, invoices))[invoice_index]
+        clients = rng.integers(1, customers + 1, invoices)[invoice_index]
+
+        yield pandas.DataFrame({
+            'ID'         : ids,
+            'Fecha'      : numpy.datetime_as_string(dates, unit = 'D'),
+            'ClienteID'  : clients,
+            'ProductoID' : rng.integers(1, products + 1, rows),
+            'Cantidad'   : rng.integers(1, 11, rows),
+            'Total'      : rng.uniform(100, 1000, rows)
+        })
+
+        next_id = ids[-1] + 1
+        written += rows
+
+def generate(
+        output_dir:str, invoices:int, customers:int = 100, products:int = 50,
+        seed:int = 0, max_lines:int = 1, days:int = 365
+    ) -> dict[str, str]:
+    """ Writes customers.csv, products.csv and invoices.csv, returns their paths. """
+    rng = numpy.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok = True)
+    paths = {
+        name : os.path.join(output_dir, f'{name}.csv')
+        for name in ('customers', 'products', 'invoices')
+    }
+
+    get_customers(customers, rng).to_csv(paths['customers'], index = False, encoding = 'utf-8')
+    get_products(products, rng).to_csv(paths['products'], index = False, encoding = 'utf-8')
+
+    chunks = iter_invoices(invoices, customers, products, rng, days = days, max_lines = max_lines)
+    for number, chunk in enumerate(chunks):
+        chunk.to_csv(
+            paths['invoices'],
+            index = False,
+            encoding = 'utf-8',
+            mode = 'a' if number > 0 else 'w',
+            header = number == 0
+        )
+    return paths
+
+
+if __name__ == "__main__":
+
+    # python src/synthetic_data.py --invoices 10000000 --output-dir /tmp/alegra
+    parser = argparse.ArgumentParser(description = 'Seeded synthetic input files, same schema as docs/input_files.')
+    parser.add_argument('--output-dir', default = 'docs/input_files_synthetic')
+    parser.add_argument('--invoices', type = int, default = 1000, help = 'invoice lines.')
+    parser.add_argument('--customers', type = int, default = 100)
+    parser.add_argument('--products', type = int, default = 50)
+    parser.add_argument('--max-lines', type = int, default = 1, help = 'max product lines per invoice.')
+    parser.add_argument('--days', type = int, default = 365, help = 'days covered, starting on 2023-01-01.')
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args()
+
+    paths = generate(
+        output_dir = args.output_dir,
+        invoices   = args.invoices,
+        customers  = args.customers,
+        products   = args.products,
+        seed       = args.seed,
+        max_lines  = args.max_lines,
+        days       = args.days
+    )
+    for name, path in paths.items():
+        print(f'{name} > {path}')
@@ -0,0 +1,137 @@
+# pip install pandas
+import json
+import os
+import numpy
+import pandas
+from typing import Callable, Union
+import core
+import stagging_tables
+
+# natural keys the invoices must reference: {rule : (file, natural key, invoice column)}
+REFERENCES:dict[str, tuple[str, str, str]] = {
+    'orphan_customer' : ("docs/output_stagging/customers.csv", 'customer_id', 'client_id'),
+    'orphan_product'  : ("docs/output_stagging/products.csv", 'product_id', 'product_id')
+}
+
+def get_reference_rule(csv_path:str, natural_key:str, column:str) -> Callable[[pandas.DataFrame], pandas.Series]:
+    """ Rule for rows referencing a key that doesn't exist (hashed key set of the file, cached). """
+    return lambda df : ~core.DIMENSION_KEYS.contains(csv_path, natural_key, df[column])
+
+# every rule marks the failing rows of a batch, as a whole column operation.
+RULES:dict[str, Callable[[pandas.DataFrame], pandas.Series]] = {
+    'invalid_date'          : lambda df : df['invoice_date'].isna(),
+    'missing_quantity'      : lambda df : df['product_quantity'].isna(),
+    'non_positive_quantity' : lambda df : (df['product_quantity'] <= 0).fillna(False),
+    'missing_total'         : lambda df : df['total_invoice'].isna(),
+    'negative_total'        : lambda df : df['total_invoice'] < 0,
+    # the same product twice on an invoice, the first line is kept.
+    'duplicate_line'        : lambda df : df.duplicated(['invoice_id', 'product_id']),
+    **{rule : get_reference_rule(*reference) for rule, reference in REFERENCES.items()}
+}
+
+def validate(
+        dataframe:pandas.DataFrame,
+        rules:dict[str, Callable[[pandas.DataFrame], pandas.Series]] = RULES
+    ) -> tuple[pandas.DataFrame, pandas.DataFrame, dict[str, int]]:
+    """
+    Evaluates every rule over the batch. Returns the valid rows, the failing
+    ones with their reasons (rule names separated by ';') and failures per rule.
+    """
+    flags = numpy.zeros(len(dataframe), dtype = numpy.uint32)
+    counts = {}
+    for bit, (rule, check) in enumerate(rules.items()):
+        failed = numpy.asarray(check(dataframe), dtype = bool)
+        flags |= failed.astype(numpy.uint32) << numpy.uint32(bit)
+        counts[rule] = int(failed.sum())
+
+    failed = flags > 0
+    quarantine = dataframe[failed].copy()
+    # reasons are built once per distinct combination of failed rules.
+    reasons = {
+        value : ';'.join(rule for bit, rule in enumerate(rules) if value >> bit & 1)
+        for value in numpy.unique(flags[failed]).tolist()
+    }
+    quarantine['reasons'] = pandas.Series(flags[failed], index = quarantine.index).map(reasons)
+    return dataframe[~failed], quarantine, counts
+
+
+class Invoice(core.ETL):
+    input_schema = stagging_tables.SCHEMAS['invoices']
+    output_schema = stagging_tables.SCHEMAS['invoices']
+    quarantine_csv_path: Union[str, None] = None
+    counts_json_path: Union[str, None] = None
+    quarantine: Union[pandas.DataFrame, None] = None
+    counts: Union[dict[str, int], None] = None
+
+    def __init__(
+            self, input_csv_path, output_csv_path,
+            quarantine_csv_path:str, counts_json_path:str
+        ) -> bool:
+        super().__init__(input_csv_path, output_csv_path)
+        self.quarantine_csv_path = quarantine_csv_path # failing rows and their reasons.
+        self.counts_json_path = counts_json_path # failures per rule of the last run.
+
+    def get_output_paths(self) -> list[str]:
+        return [self.output_csv_path, self.quarantine_csv_path, self.counts_json_path]
+
+    def get_dependency_paths(self) -> list[str]:
+        return [csv_path for csv_path, natural_key, column in REFERENCES.values()]
+
+    def extract(self) -> bool:
+        result = super().extract()
+        print('Invoice.extract > ', str(result))
+        return result
+
+    def transform(self) -> bool:
+        try:
+            rows = len(self.data)
+            self.data, self.quarantine, self.counts = validate(self.data)
+            self.counts = {
+                'rows'        : rows,
+                'valid'       : len(self.data),
+                'quarantined' : len(self.quarantine),
+                **self.counts
+            }
+            print('Invoice.transform > ', str(self.counts))
+            return True
+        except Exception as e:
+            print('Invoice.transform > ERROR: ', str(e))
+            return False
+
+    def load(self) -> bool:
+        result = super().load()
+        if result and self.quarantine is not None:
+            result = core.save_data(
+                dataframe = core.apply_schema(self.quarantine, self.output_schema),
+                csv_path = self.quarantine_csv_path
+            )
+            with open(self.counts_json_path, 'w', encoding = 'utf-8') as file:
+                json.dump(self.counts, file, indent = 4)
+        print('Invoice.load > ', str(result))
+        return result
+
+
+def get_tables() -> dict[str, core.ETL]:
+    """ Tables of the validation stage, by name. """
+    os.makedirs("docs/output_validation", exist_ok = True)
+
+    invoices:Invoice  = Invoice(
+        input_csv_path      = "docs/output_stagging/invoices.csv",
+        # named apart from the staging invoices: the table name (metrics, state
+        # and cache entries) comes from the file name.
+        output_csv_path     = "docs/output_validation/invoices_valid.csv",
+        quarantine_csv_path = "docs/output_validation/invoices_quarantine.csv",
+        counts_json_path    = "docs/output_validation/invoices_rules.json"
+    )
+
+    return {
+        'invoices' : invoices
+    }
+
+
+if __name__ == "__main__":
+
+    # runs between both stages: python src/stagging_tables.py,
+    # python src/validation_tables.py, python src/data_warehouse_tables.py
+    for table in get_tables().values():
+        table.run()
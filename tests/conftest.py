@@ -0,0 +1,29 @@
+import os
+import shutil
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the ETL modules import each other as top level modules (python src/...).
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import core
+
+OUTPUT_FOLDERS = ['output_stagging', 'output_validation', 'output_data_warehouse']
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Working directory with a copy of the sample inputs and empty output
+    folders (tables use paths relative to the repository), and the process
+    wide switches of core turned off.
+    """
+    shutil.copytree(os.path.join(ROOT, 'docs', 'input_files'), tmp_path / 'docs' / 'input_files')
+    for folder in OUTPUT_FOLDERS:
+        (tmp_path / 'docs' / folder).mkdir()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(core, 'DIMENSION_KEYS', core.DimensionKeyCache())
+    monkeypatch.setattr(core, 'FRAMES', None)
+    monkeypatch.setattr(core, 'METRICS', None)
+    monkeypatch.setattr(core, 'BUILD_CACHE', None)
+    return tmp_path
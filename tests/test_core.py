@@ -0,0 +1,17 @@
+import pandas
+import pytest
+import core
+import stagging_tables
+
+@pytest.mark.parametrize('storage_format', ['csv', 'parquet', 'feather'])
+def test_stream_writes_every_chunk(workdir, monkeypatch, storage_format):
+    if storage_format != 'csv':
+        pytest.importorskip('pyarrow')
+    monkeypatch.setattr(stagging_tables.Invoice, 'output_format', storage_format)
+    invoices = stagging_tables.get_tables(chunk_size = 300)['invoices']
+
+    assert invoices.output_csv_path.endswith('.' + storage_format)
+    assert invoices.run()
+    df = core.get_data(invoices.output_csv_path, schema = stagging_tables.SCHEMAS['invoices'])
+    source = pandas.read_csv('docs/input_files/invoices.csv')
+    assert df['invoice_id'].tolist() == source['ID'].tolist()
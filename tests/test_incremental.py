@@ -0,0 +1,89 @@
+import os
+import sqlite3
+import pytest
+import pandas
+import core
+import data_warehouse_tables
+import pipeline
+
+def run_incremental() -> dict[str, bool]:
+    state = core.StateStore(data_warehouse_tables.STATE_PATH)
+    return pipeline.Pipeline(pipeline.get_tables(state = state)).run()
+
+def add_invoices(rows:list[dict]) -> None:
+    invoices = pandas.read_csv('docs/input_files/invoices.csv')
+    invoices = pandas.concat([invoices, pandas.DataFrame(rows)], ignore_index = True)
+    invoices.to_csv('docs/input_files/invoices.csv', index = False)
+
+def read_fact() -> pandas.DataFrame:
+    return pandas.read_csv('docs/output_data_warehouse/fact_invoices.csv')
+
+def test_incremental_run_is_idempotent(workdir):
+    assert all(run_incremental().values())
+    fact = read_fact()
+    time_dim = data_warehouse_tables.read_table('time_dim')
+    assert fact['id'].is_unique and fact['time_id'].notna().all()
+
+    # the same inputs again add nothing.
+    assert all(run_incremental().values())
+    assert read_fact().equals(fact)
+    assert data_warehouse_tables.read_table('time_dim')['id'].tolist() == time_dim['id'].tolist()
+    assert os.path.isdir(core.get_key_index_path('docs/output_data_warehouse/fact_invoices.csv'))
+
+def test_rows_up_to_the_mark_are_loaded_once(workdir):
+    assert all(run_incremental().values())
+    rows = len(read_fact())
+
+    # same day as the high-water mark, and an older one.
+    add_invoices([
+        {'ID' : 1001, 'Fecha' : '2023-12-31', 'ClienteID' : 5, 'ProductoID' : 3, 'Cantidad' : 2, 'Total' : 40.0},
+        {'ID' : 1002, 'Fecha' : '2023-06-01', 'ClienteID' : 6, 'ProductoID' : 4, 'Cantidad' : 1, 'Total' : 25.0}
+    ])
+    assert all(run_incremental().values())
+    assert all(run_incremental().values())
+
+    fact = read_fact()
+    assert len(fact) == rows + 2 and fact['id'].is_unique
+    late = fact[fact['invoice_id'].isin([1001, 1002])]
+    assert sorted(late['invoice_id']) == [1001, 1002] and late['time_id'].notna().all()
+
+def test_late_invoice_before_the_calendar_gets_a_time_id(workdir):
+    assert all(run_incremental().values())
+    add_invoices([{'ID' : 2010, 'Fecha' : '2022-12-15', 'ClienteID' : 8, 'ProductoID' : 9, 'Cantidad' : 3, 'Total' : 60.0}])
+    assert all(run_incremental().values())
+
+    time_dim = data_warehouse_tables.read_table('time_dim').sort_values('date')
+    # still one contiguous range, with the new days before the old ones.
+    assert time_dim['date'].min() == pandas.Timestamp('2022-12-15') and time_dim['id'].is_unique
+    assert len(time_dim) == (time_dim['date'].max() - time_dim['date'].min()).days + 1
+
+    fact = read_fact()
+    late = fact[fact['invoice_id'] == 2010].iloc[0]
+    assert time_dim.set_index('id').loc[late['time_id'], 'date'] == pandas.Timestamp('2022-12-15')
+    headers = pandas.read_csv('docs/output_data_warehouse/fact_invoice_headers.csv')
+    assert (headers['invoice_id'] == 2010).sum() == 1
+
+def test_headers_merge_only_late_lines(workdir):
+    sql_target = core.SqlTarget('warehouse.sqlite', engine = 'sqlite', mode = 'upsert')
+    state = core.StateStore(data_warehouse_tables.STATE_PATH)
+    assert all(pipeline.Pipeline(pipeline.get_tables(state = state, sql_target = sql_target)).run().values())
+    before = pandas.read_csv(data_warehouse_tables.INVOICE_HEADERS_PATH).set_index('invoice_id')
+
+    # a late line of a saved invoice, and a new invoice.
+    add_invoices([
+        {'ID' : 1, 'Fecha' : '2023-11-10', 'ClienteID' : 62, 'ProductoID' : 25, 'Cantidad' : 1, 'Total' : 10.0},
+        {'ID' : 1001, 'Fecha' : '2023-12-31', 'ClienteID' : 5, 'ProductoID' : 3, 'Cantidad' : 2, 'Total' : 40.0}
+    ])
+    assert all(pipeline.Pipeline(pipeline.get_tables(state = state, sql_target = sql_target)).run().values())
+
+    headers = pandas.read_csv(data_warehouse_tables.INVOICE_HEADERS_PATH)
+    assert headers['invoice_id'].is_unique and len(headers) == len(before) + 1
+    headers = headers.set_index('invoice_id')
+    assert headers.loc[1, 'line_count'] == before.loc[1, 'line_count'] + 1
+    assert headers.loc[1, 'total_invoice'] == pytest.approx(before.loc[1, 'total_invoice'] + 10.0)
+    assert headers.loc[1001, 'line_count'] == 1
+
+    connection = sqlite3.connect('warehouse.sqlite')
+    sql_headers = pandas.read_sql('SELECT * FROM fact_invoice_headers', connection).set_index('invoice_id')
+    connection.close()
+    assert sql_headers['total_invoice'].sort_index().tolist() == pytest.approx(headers['total_invoice'].sort_index().tolist())
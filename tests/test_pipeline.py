@@ -0,0 +1,50 @@
+import os
+import pandas
+import core
+import pipeline
+
+def test_fused_run_releases_frames(workdir, monkeypatch):
+    frames = core.enable_frame_store()
+    monkeypatch.setattr(core, 'FRAMES', frames)
+    tables = pipeline.get_tables()
+    for name, table in tables.items():
+        if not name.startswith('warehouse.'):
+            table.write_output = False
+
+    results = pipeline.Pipeline(tables).run()
+
+    assert all(results.values())
+    # only read outputs were kept, and each one until its last reader finished.
+    assert frames.frames == {}
+    assert not os.path.exists('docs/output_validation/invoices_valid.csv')
+    fact = pandas.read_csv('docs/output_data_warehouse/fact_invoices.csv')
+    assert len(fact) == len(pandas.read_csv('docs/input_files/invoices.csv'))
+    assert fact['time_id'].notna().all()
+
+def test_build_cache_restores_unchanged_tables(workdir, monkeypatch, capsys):
+    cache = core.BuildCache(str(workdir / 'cache'))
+    monkeypatch.setattr(core, 'BUILD_CACHE', cache)
+    tables = len(pipeline.get_tables())
+
+    assert all(pipeline.Pipeline(pipeline.get_tables()).run().values())
+    assert capsys.readouterr().out.count('.run > cached') == 0
+    # the versioned dimensions also read their own output, saved by the first run.
+    assert all(pipeline.Pipeline(pipeline.get_tables()).run().values())
+    assert capsys.readouterr().out.count('.run > cached') == tables - 2
+    fact = pandas.read_csv('docs/output_data_warehouse/fact_invoices.csv')
+
+    assert all(pipeline.Pipeline(pipeline.get_tables()).run().values())
+    assert capsys.readouterr().out.count('.run > cached') == tables
+    assert pandas.read_csv('docs/output_data_warehouse/fact_invoices.csv').equals(fact)
+
+    # a changed input rebuilds the tables reading it, and the ones after them.
+    products = pandas.read_csv('docs/input_files/products.csv')
+    products.loc[0, 'Precio'] = products.loc[0, 'Precio'] + 1
+    products.to_csv('docs/input_files/products.csv', index = False)
+    assert all(pipeline.Pipeline(pipeline.get_tables()).run().values())
+    out = capsys.readouterr().out
+    assert 'Customer.run > cached' in out and 'Product.run > cached' not in out
+
+    assert cache.invalidate() > 0
+    assert all(pipeline.Pipeline(pipeline.get_tables()).run().values())
+    assert capsys.readouterr().out.count('.run > cached') == 0
@@ -0,0 +1,33 @@
+import json
+import pandas
+import pipeline
+
+BAD_INVOICES = [
+    {'ID' : 1001, 'Fecha' : 'not a date', 'ClienteID' : 1, 'ProductoID' : 1, 'Cantidad' : 1, 'Total' : 10.0},
+    {'ID' : 1002, 'Fecha' : '2023-05-01', 'ClienteID' : 1, 'ProductoID' : 1, 'Cantidad' : None, 'Total' : 10.0},
+    {'ID' : 1003, 'Fecha' : '2023-05-01', 'ClienteID' : 999, 'ProductoID' : 1, 'Cantidad' : 0, 'Total' : 10.0},
+    {'ID' : 1004, 'Fecha' : '2023-05-01', 'ClienteID' : 1, 'ProductoID' : 999, 'Cantidad' : 1, 'Total' : -5.0},
+    # same product as the first line of invoice 1.
+    {'ID' : 1, 'Fecha' : '2023-11-10', 'ClienteID' : 62, 'ProductoID' : 24, 'Cantidad' : 1, 'Total' : 10.0}
+]
+
+def test_rule_counts_and_quarantine(workdir):
+    invoices = pandas.read_csv('docs/input_files/invoices.csv')
+    pandas.concat([invoices, pandas.DataFrame(BAD_INVOICES)]).to_csv('docs/input_files/invoices.csv', index = False)
+    assert all(pipeline.Pipeline(pipeline.get_tables()).run().values())
+
+    with open('docs/output_validation/invoices_rules.json', encoding = 'utf-8') as file:
+        counts = json.load(file)
+    assert counts == {
+        'rows' : len(invoices) + 5, 'valid' : len(invoices), 'quarantined' : 5,
+        'invalid_date' : 1, 'missing_quantity' : 1, 'non_positive_quantity' : 1,
+        'missing_total' : 0, 'negative_total' : 1, 'duplicate_line' : 1,
+        'orphan_customer' : 1, 'orphan_product' : 1
+    }
+
+    quarantine = pandas.read_csv('docs/output_validation/invoices_quarantine.csv').set_index('invoice_id')
+    assert quarantine.loc[1003, 'reasons'] == 'non_positive_quantity;orphan_customer'
+    assert quarantine.loc[1004, 'reasons'] == 'negative_total;orphan_product'
+    assert quarantine.loc[1, 'reasons'] == 'duplicate_line'
+    fact = pandas.read_csv('docs/output_data_warehouse/fact_invoices.csv')
+    assert len(fact) == len(invoices) and not fact['invoice_id'].isin([1001, 1002, 1003, 1004]).any()
@@ -0,0 +1,60 @@
+import pandas
+import core
+import data_warehouse_tables
+import pipeline
+import query
+
+def run_pipeline(**kwargs) -> dict[str, bool]:
+    return pipeline.Pipeline(pipeline.get_tables(**kwargs)).run()
+
+def change_segment(customer_id:int, segment:str) -> None:
+    customers = pandas.read_csv('docs/input_files/customers.csv')
+    customers.loc[customers['ID'] == customer_id, 'Segmento'] = segment
+    customers.to_csv('docs/input_files/customers.csv', index = False)
+
+def read_customers_dim() -> pandas.DataFrame:
+    return data_warehouse_tables.read_table('customers_dim')
+
+def test_scd2_opens_and_closes_versions(workdir, monkeypatch):
+    assert all(run_pipeline().values())
+    first = read_customers_dim()
+    assert len(first) == 100 and first['is_current'].all()
+
+    # an unchanged snapshot adds no versions.
+    assert all(run_pipeline().values())
+    assert read_customers_dim()['id'].tolist() == first['id'].tolist()
+
+    changed_at = pandas.Timestamp('2023-07-01')
+    monkeypatch.setattr(core, 'RUN_TIMESTAMP', changed_at)
+    change_segment(7, 'Corporativo')
+    assert all(run_pipeline().values())
+
+    versions = read_customers_dim()
+    assert len(versions) == 101
+    customer = versions[versions['customer_id'] == 7].sort_values('valid_from')
+    old, new = customer.iloc[0], customer.iloc[1]
+    assert not old['is_current'] and old['valid_to'] == changed_at
+    assert new['is_current'] and new['valid_from'] == changed_at and pandas.isna(new['valid_to'])
+    assert new['segment_name'] == 'Corporativo' and new['id'] == first['id'].max() + 1
+    assert versions[versions['customer_id'] != 7]['is_current'].all()
+
+def test_customer_versions_are_counted_together(workdir, monkeypatch):
+    assert all(run_pipeline().values())
+    monkeypatch.setattr(core, 'RUN_TIMESTAMP', pandas.Timestamp('2023-07-01'))
+    change_segment(7, 'Corporativo')
+    assert all(run_pipeline().values())
+
+    # the invoices of customer 7 reference both of its versions.
+    fact = data_warehouse_tables.read_fact_invoices()
+    versions = read_customers_dim().query('customer_id == 7')['id']
+    assert set(fact['customer_id']).issuperset(set(versions))
+
+    top = query.WarehouseQueries(engine = 'sqlite').query(
+        query.LOYAL_CUSTOMER_TRENDS.split('categories_per_customer AS')[0].rstrip().rstrip(',')
+        + '\nSELECT * FROM top_customers', [100]
+    )
+    assert top['customer_id'].is_unique and 7 in top['customer_id'].tolist()
+
+    rollup = pandas.read_csv(data_warehouse_tables.ROLLUPS['sales_customer_month'][0])
+    assert not rollup.duplicated(['customer_id', 'year', 'month']).any()
+    assert set(rollup['customer_id']) <= set(range(1, 101))